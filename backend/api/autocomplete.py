@@ -0,0 +1,64 @@
+import bisect
+import threading
+
+from django.db import DatabaseError
+
+from recipes.cache import get_version
+from recipes.models import Ingredient
+
+
+class IngredientIndex:
+    """In-memory copy of the ingredient catalogue sorted by name.
+
+    Prefix lookups are answered with bisect over the case folded names
+    without touching the database. The index is rebuilt when the shared
+    Ingredient version (bumped on every save/delete and by load_csv)
+    differs from the one it was built with, so all workers converge.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._index = ([], [])
+
+    def refresh(self):
+        version = get_version(Ingredient)
+        rows = sorted(
+            Ingredient.objects.values_list("id", "name", "measurement_unit"),
+            key=lambda row: (row[1].casefold(), row[0]),
+        )
+        keys = [name.casefold() for _, name, _ in rows]
+        with self._lock:
+            # One attribute so readers never pair keys of one build with
+            # rows of another.
+            self._index = (keys, rows)
+            self._version = version
+
+    def warm(self):
+        """Builds the index at worker startup if the database is ready."""
+        try:
+            self.refresh()
+        except DatabaseError:
+            pass
+
+    def search(self, prefix, limit):
+        if self._version != get_version(Ingredient):
+            self.refresh()
+        keys, rows = self._index
+        key = prefix.casefold()
+        start = bisect.bisect_left(keys, key)
+        end = bisect.bisect_right(keys, key + "\U0010ffff", lo=start)
+        # Same order as IngredientSearchFilter's query.
+        found = sorted(
+            rows[start:end],
+            key=lambda row: (
+                row[1].casefold() != key, len(row[1]), row[1], row[0]
+            ),
+        )
+        return [
+            Ingredient(id=pk, name=name, measurement_unit=measurement_unit)
+            for pk, name, measurement_unit in found[:limit]
+        ]
+
+
+ingredient_index = IngredientIndex()
@@ -1,19 +1,66 @@
+from django.conf import settings
+from django.db.models import (Case, Count, Exists, IntegerField, OuterRef,
+                              Value, When)
+from django.db.models.functions import Length
 from django_filters import rest_framework as filter
 from rest_framework import filters
 
-from recipes.models import Recipe
+from api.autocomplete import ingredient_index
+from recipes.models import Recipe, Tag
 
 
 class RecipeFilter(filter.FilterSet):
     """Custom filter for recipes endpoint."""
-    tags = filter.CharFilter(field_name="tags__slug", lookup_expr="iexact")
+    tags = filter.CharFilter(method="filter_tags")
+    tags_mode = filter.ChoiceFilter(
+        choices=(("any", "Any of the tags"), ("all", "All of the tags")),
+        method="filter_tags_mode",
+    )
     is_favorited = filter.BooleanFilter(method="filter_favorited")
     is_in_shopping_cart = filter.BooleanFilter(method="filter_shopping_cart")
+    search = filter.CharFilter(method="filter_search")
+    ordering = filter.OrderingFilter(
+        fields=(
+            ("pub_date", "pub_date"),
+            ("favorites_count", "popular"),
+        )
+    )
 
     class Meta:
         model = Recipe
         fields = ["author", "tags", "is_favorited"]
 
+    def filter_tags(self, queryset, name, value):
+        """Recipes with any (default) or all of the repeated ?tags= slugs,
+        as one subquery on the recipe-tag table, without duplicates.
+        """
+        slugs = set(self.data.getlist(name))
+        through = Recipe.tags.through.objects
+        if self.data.get("tags_mode") == "all":
+            matching = (
+                through.filter(tag__slug__in=slugs)
+                .values("recipe_id")
+                .annotate(matched=Count("tag_id"))
+                .filter(matched=len(slugs))
+                .values("recipe_id")
+            )
+            return queryset.filter(pk__in=matching)
+        return queryset.filter(
+            Exists(
+                through.filter(
+                    recipe_id=OuterRef("pk"),
+                    tag_id__in=Tag.objects.filter(slug__in=slugs).values("id"),
+                )
+            )
+        )
+
+    def filter_tags_mode(self, queryset, name, value):
+        """Only switches the mode of the tags filter."""
+        return queryset
+
+    def filter_search(self, queryset, name, value):
+        return queryset.search(value)
+
     def filter_favorited(self, queryset, name, value):
         if value:
             return queryset.filter(Users__user=self.request.user)
@@ -25,6 +72,36 @@ class RecipeFilter(filter.FilterSet):
         return queryset
 
 
-class IngredientSearchFilter(filters.SearchFilter):
-    """Custom search filter for ingredients."""
+class IngredientSearchFilter(filters.BaseFilterBackend):
+    """Autocomplete filter for ingredients.
+
+    Matches the beginning of the name (served by the UPPER(name) prefix
+    index), puts the exact match first, then shorter names, and caps
+    the number of results returned by the list endpoint. With the
+    INGREDIENT_INDEX setting on, list lookups are answered from the
+    in-process ingredient index instead of the database.
+    """
     search_param = "name"
+
+    def filter_queryset(self, request, queryset, view):
+        name = request.query_params.get(self.search_param, "").strip()
+        if not name:
+            return queryset
+        is_list = getattr(view, "action", None) == "list"
+        if is_list and settings.INGREDIENT_INDEX:
+            return ingredient_index.search(
+                name, settings.INGREDIENT_AUTOCOMPLETE_LIMIT
+            )
+        queryset = queryset.filter(name__istartswith=name).order_by(
+            Case(
+                When(name__iexact=name, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField(),
+            ),
+            Length("name"),
+            "name",
+            "id",
+        )
+        if is_list:
+            queryset = queryset[: settings.INGREDIENT_AUTOCOMPLETE_LIMIT]
+        return queryset
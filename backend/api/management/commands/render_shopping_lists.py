@@ -0,0 +1,100 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from api.models import ShoppingListExport
+from api.utils import render_shopping_list
+
+
+class Command(BaseCommand):
+    help = "Renders queued shopping list PDFs"
+    # Seconds between two passes deleting expired exports
+    expire_every = 60 * 60
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit when the queue is empty instead of waiting",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait before polling an empty queue again",
+        )
+
+    def handle(self, *args, **options):
+        next_expiry = 0
+        while True:
+            job = self._claim_job()
+            if job is None:
+                if time.monotonic() >= next_expiry:
+                    self._expire()
+                    next_expiry = time.monotonic() + self.expire_every
+                if options.get("once"):
+                    break
+                time.sleep(options.get("interval"))
+                continue
+            self._render(job)
+
+    def _claim_job(self):
+        # Jobs still processing after SHOPPING_LIST_JOB_TIMEOUT were
+        # claimed by a worker that died, they are taken over.
+        with transaction.atomic():
+            job = (
+                ShoppingListExport.objects.select_for_update(skip_locked=True)
+                .filter(
+                    Q(status=ShoppingListExport.Status.PENDING)
+                    | Q(
+                        status=ShoppingListExport.Status.PROCESSING,
+                        updated__lt=ShoppingListExport.stale_before(),
+                    )
+                )
+                .first()
+            )
+            if job is not None:
+                job.status = ShoppingListExport.Status.PROCESSING
+                job.save(update_fields=["status", "updated"])
+        return job
+
+    def _render(self, job):
+        try:
+            document = render_shopping_list(job.content)
+            job.file.save(f"{job.digest}.pdf", ContentFile(document))
+        except Exception as error:
+            job.status = ShoppingListExport.Status.FAILED
+            job.save(update_fields=["status", "updated"])
+            self.stderr.write(f"Failed to render {job.digest}: {error}")
+            return
+        job.status = ShoppingListExport.Status.DONE
+        job.save(update_fields=["status", "updated"])
+        self.stdout.write(f"Rendered {job.digest}")
+
+    def _expire(self):
+        """Deletes finished exports older than SHOPPING_LIST_EXPORT_TTL
+        together with their files.
+        """
+        expired = ShoppingListExport.objects.filter(
+            status__in=(
+                ShoppingListExport.Status.DONE,
+                ShoppingListExport.Status.FAILED,
+            ),
+            updated__lt=timezone.now() - timedelta(
+                seconds=settings.SHOPPING_LIST_EXPORT_TTL
+            ),
+        )
+        deleted = 0
+        for job in expired.iterator():
+            if job.file:
+                job.file.delete(save=False)
+            job.delete()
+            deleted += 1
+        if deleted:
+            self.stdout.write(f"Deleted {deleted} expired exports")
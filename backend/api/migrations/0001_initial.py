@@ -0,0 +1,31 @@
+# Generated by Django 3.2 on 2026-10-18 03:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListExport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True, verbose_name='Content digest')),
+                ('content', models.JSONField(verbose_name='Ingredients to render')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='pending', max_length=10, verbose_name='Status')),
+                ('file', models.FileField(default=None, null=True, upload_to='shopping_lists/')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Date created')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Date updated')),
+            ],
+            options={
+                'verbose_name': 'Shopping list export',
+                'verbose_name_plural': 'Shopping list exports',
+                'ordering': ['created'],
+            },
+        ),
+    ]
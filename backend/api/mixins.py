@@ -0,0 +1,135 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from recipes.cache import get_version
+from recipes.models import CartRecipe, FavoriteRecipe, Ingredient, Recipe, Tag
+from users.models import Follow, User
+
+
+class CachedReferenceMixin:
+    """Caches list/retrieve responses of nearly static endpoints.
+
+    The cache key and the ETag are derived from the versions of
+    `cache_models` and the full request path, so any save or delete of
+    those models invalidates every cached response at once. Requests
+    with a matching If-None-Match get 304 without touching the DB.
+    """
+
+    cache_models = ()
+
+    def get_etag(self, request):
+        versions = ":".join(
+            str(get_version(model)) for model in self.cache_models
+        )
+        digest = hashlib.md5(
+            f"{versions}:{request.get_full_path()}".encode()
+        ).hexdigest()
+        return f'"{digest}"'
+
+    def list(self, request, *args, **kwargs):
+        return self._cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def _cached_response(self, handler, request, *args, **kwargs):
+        etag = self.get_etag(request)
+        if etag in parse_etags(request.META.get("HTTP_IF_NONE_MATCH", "")):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            key = f"response:{etag}"
+            data = cache.get(key)
+            if data is None:
+                response = handler(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                cache.set(
+                    key, response.data, settings.REFERENCE_CACHE_TIMEOUT
+                )
+            else:
+                response = Response(data)
+        response["ETag"] = etag
+        patch_cache_control(response, public=True, no_cache=True)
+        return response
+
+
+class ConditionalRecipeMixin:
+    """Conditional GET for recipe list and retrieve.
+
+    The ETag combines the cached versions of everything a recipe payload
+    shows: recipes (retrieve uses the recipe's updated_at instead), the
+    tags, ingredients and authors they embed and, for authenticated
+    users, their favorites, cart and subscriptions. Lists ordered by
+    popularity also depend on everybody's favorites. Requests with a
+    matching If-None-Match get 304 before anything is serialized.
+
+    There is no Last-Modified: the embedded data has no modification
+    time of its own.
+    """
+
+    etag_models = (Tag, Ingredient, User)
+    viewer_models = (FavoriteRecipe, CartRecipe, Follow)
+    ordering_models = (FavoriteRecipe,)
+
+    def get_etag(self, request, recipes_version):
+        versions = [recipes_version]
+        versions += [get_version(model) for model in self.etag_models]
+        if "ordering" in request.query_params:
+            versions += [get_version(model) for model in self.ordering_models]
+        if request.user.is_authenticated:
+            versions += [
+                get_version(model, request.user.pk)
+                for model in self.viewer_models
+            ]
+        digest = hashlib.md5(
+            f"{versions}:{request.get_full_path()}".encode()
+        ).hexdigest()
+        return f'"{digest}"'
+
+    def list(self, request, *args, **kwargs):
+        etag = self.get_etag(request, get_version(Recipe))
+        return self._conditional_response(
+            super().list, request, etag, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        try:
+            updated_at = (
+                Recipe.objects.filter(pk=lookup)
+                .values_list("updated_at", flat=True)
+                .first()
+            )
+        except (TypeError, ValueError):
+            updated_at = None
+        if updated_at is None:
+            return super().retrieve(request, *args, **kwargs)
+        etag = self.get_etag(request, updated_at.isoformat())
+        return self._conditional_response(
+            super().retrieve, request, etag, *args, **kwargs
+        )
+
+    def _conditional_response(self, handler, request, etag, *args,
+                              **kwargs):
+        if_none_match = request.META.get("HTTP_IF_NONE_MATCH", "")
+        if etag in parse_etags(if_none_match):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        response["ETag"] = etag
+        if request.user.is_authenticated:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            patch_cache_control(response, public=True, no_cache=True)
+        patch_vary_headers(response, ("Authorization",))
+        return response
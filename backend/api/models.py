@@ -0,0 +1,58 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+
+class ShoppingListExport(models.Model):
+    """Shopping list PDF rendered by the render_shopping_lists worker.
+
+    Jobs are keyed by the digest of the aggregated ingredients, so
+    identical carts share one render. Finished exports are deleted with
+    their files by the worker SHOPPING_LIST_EXPORT_TTL seconds after they
+    were rendered.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        PROCESSING = "processing", "Processing"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
+    digest = models.CharField("Content digest", max_length=64, unique=True)
+    content = models.JSONField("Ingredients to render")
+    status = models.CharField(
+        "Status",
+        max_length=10,
+        choices=Status.choices,
+        default=Status.PENDING,
+        db_index=True,
+    )
+    file = models.FileField(
+        upload_to="shopping_lists/", null=True, default=None
+    )
+    created = models.DateTimeField("Date created", auto_now_add=True)
+    updated = models.DateTimeField("Date updated", auto_now=True)
+
+    class Meta:
+        ordering = ["created"]
+        verbose_name = "Shopping list export"
+        verbose_name_plural = "Shopping list exports"
+
+    def __str__(self):
+        return f"{self.digest} ({self.status})"
+
+    @classmethod
+    def stale_before(cls):
+        """Jobs processing since before this were left by a dead worker."""
+        return timezone.now() - timedelta(
+            seconds=settings.SHOPPING_LIST_JOB_TIMEOUT
+        )
+
+    @property
+    def is_stale(self):
+        return (
+            self.status == self.Status.PROCESSING
+            and self.updated < self.stale_before()
+        )
@@ -1,6 +1,214 @@
-from rest_framework.pagination import PageNumberPagination
+import functools
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
+
+
+class KeysetPagination(CursorPagination):
+    """Keyset pagination over descending unique keys.
+
+    DRF's CursorPagination keys on the first ordering field plus an
+    offset. Here the cursor stores the values of all `keyset_fields`
+    (taken from the view if it defines them) of the last row, so every
+    page is a single index range scan whatever its depth. Only forward
+    links are produced, which is what infinite scrolling needs.
+    """
+
+    page_size_query_param = "limit"
+    keyset_fields = ("pub_date", "id")
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.fields = getattr(view, "keyset_fields", self.keyset_fields)
+        cursor = self.decode_cursor(request)
+        position = (
+            None if cursor is None
+            else self._position(queryset.model, cursor.position)
+        )
+        results = list(
+            self.rows_after(queryset, position)[: self.page_size + 1]
+        )
+        self.has_next = len(results) > self.page_size
+        self.page = results[: self.page_size]
+        return self.page
+
+    def decode_cursor(self, request):
+        if not request.query_params.get(self.cursor_query_param):
+            return None
+        return super().decode_cursor(request)
+
+    def _position(self, model, position):
+        """Key values of the last row of the previous page."""
+        try:
+            values = json.loads(position)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            values = [
+                model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in values:
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def rows_after(self, queryset, position):
+        """Rows in keyset order that follow the position, all of them for
+        the first page: (a < x) or (a = x and b < y) or ...
+        """
+        queryset = queryset.order_by(*(f"-{field}" for field in self.fields))
+        if position is None:
+            return queryset
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.fields, position):
+            condition |= Q(**equal, **{f"{field}__lt": value})
+            equal[field] = value
+        return queryset.filter(condition)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        values = []
+        for field in self.fields:
+            value = getattr(last, field)
+            values.append(
+                value.isoformat() if hasattr(value, "isoformat") else value
+            )
+        cursor = Cursor(offset=0, reverse=False, position=json.dumps(values))
+        return self.encode_cursor(cursor)
+
+    def get_previous_link(self):
+        return None
+
+
+class FeedKeysetPagination(KeysetPagination):
+    """KeysetPagination over a recipes.feed.Feed, which reads on from the
+    position itself.
+    """
+
+    def rows_after(self, feed, position):
+        return feed if position is None else feed.after(*position)
+
+
+class CountingPaginator(Paginator):
+    """Paginator with a pluggable strategy for the total count.
+
+    - exact: COUNT(*) on every request;
+    - cached: COUNT(*) cached for RECIPES_COUNT_CACHE_TIMEOUT seconds
+      under `cache_key`;
+    - estimated: the PostgreSQL planner row estimate for unfiltered
+      querysets of large tables, cached counts otherwise.
+    """
+
+    def __init__(self, *args, count_strategy="exact", cache_key=None,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self.count_strategy = count_strategy
+        self.cache_key = cache_key
+
+    @cached_property
+    def count(self):
+        if self.count_strategy == "estimated":
+            estimate = self._estimated_count()
+            if estimate is not None:
+                return estimate
+        if self.count_strategy in ("cached", "estimated") and self.cache_key:
+            return cache.get_or_set(
+                self.cache_key,
+                lambda: super(CountingPaginator, self).count,
+                settings.RECIPES_COUNT_CACHE_TIMEOUT,
+            )
+        return super().count
+
+    def _estimated_count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != "postgresql" or queryset.query.where:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # Small or never analyzed tables are counted exactly.
+        if row is None or row[0] < settings.RECIPES_COUNT_ESTIMATE_MIN:
+            return None
+        return row[0]
 
 
 class RecipesPagination(PageNumberPagination):
-    """Custom pagination class for recipes."""
+    """Custom pagination class for recipes. Passing ?cursor= (empty for
+    the first page) switches to keyset pagination. Keyset pages follow
+    the default newest-first order only, so explicitly ordered or ranked
+    querysets (?ordering=, ?search=, by_ingredients) keep page numbers.
+    Page numbers use the RECIPES_COUNT_STRATEGY to get the total count.
+    """
     page_size_query_param = 'limit'
+    keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if (
+            KeysetPagination.cursor_query_param in request.query_params
+            and not queryset.query.order_by
+        ):
+            self.keyset = KeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.django_paginator_class = functools.partial(
+            CountingPaginator,
+            count_strategy=settings.RECIPES_COUNT_STRATEGY,
+            cache_key=self.get_count_cache_key(request),
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_count_cache_key(self, request):
+        """Counts depend on the filters and, for favorites, carts and
+        subscriptions, on the user, but not on the requested page.
+        """
+        params = sorted(
+            (key, value)
+            for key, value in request.query_params.lists()
+            if key not in (self.page_query_param, self.page_size_query_param)
+        )
+        digest = hashlib.md5(
+            f"{request.path}:{request.user.pk}:{params}".encode()
+        ).hexdigest()
+        return f"pagination-count:{digest}"
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class FeedPagination(RecipesPagination):
+    """Pagination of recipes.feed.Feed. Feeds are short and counted
+    exactly; ?cursor= switches to keyset pages as for recipes.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if KeysetPagination.cursor_query_param in request.query_params:
+            self.keyset = FeedKeysetPagination()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return PageNumberPagination.paginate_queryset(
+            self, queryset, request, view
+        )
@@ -0,0 +1,37 @@
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.parsers import FormParser, JSONParser
+
+
+class RequestTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = "Request body is too large."
+    default_code = "request_too_large"
+
+
+class BodySizeLimitMixin:
+    """Refuses bodies over DATA_UPLOAD_MAX_MEMORY_SIZE from their
+    Content-Length, before anything is read. DRF parsers read the
+    request stream directly, so Django's own check never runs for them.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        limit = settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        request = (parser_context or {}).get("request")
+        if limit is not None and request is not None:
+            try:
+                length = int(request.META.get("CONTENT_LENGTH") or 0)
+            except ValueError:
+                length = 0
+            if length > limit:
+                raise RequestTooLarge()
+        return super().parse(stream, media_type, parser_context)
+
+
+class LimitedJSONParser(BodySizeLimitMixin, JSONParser):
+    pass
+
+
+class LimitedFormParser(BodySizeLimitMixin, FormParser):
+    pass
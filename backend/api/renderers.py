@@ -0,0 +1,33 @@
+import json
+
+from rest_framework.renderers import BaseRenderer
+
+
+class FileRenderer(BaseRenderer):
+    """Lets DRF negotiate a file format from ?format= or the Accept
+    header. The view builds the file response itself, so only error
+    responses are rendered here.
+    """
+
+    charset = "utf-8"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return json.dumps(data, ensure_ascii=False).encode()
+
+
+class PDFRenderer(FileRenderer):
+    media_type = "application/pdf"
+    format = "pdf"
+    charset = None
+
+
+class PlainTextRenderer(FileRenderer):
+    media_type = "text/plain"
+    format = "txt"
+
+
+class CSVRenderer(FileRenderer):
+    media_type = "text/csv"
+    format = "csv"
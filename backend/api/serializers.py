@@ -1,19 +1,21 @@
-import base64
-
 from django.conf import settings
-from django.core.files.base import ContentFile
 from django.core.validators import EmailValidator, RegexValidator
+from django.db import transaction
 from rest_framework import serializers
 
+from api.models import ShoppingListExport
+from api.viewer import get_viewer_state
+from recipes import images, shopping_list
 from recipes.models import (
     CartRecipe,
     FavoriteRecipe,
     Ingredient,
     Recipe,
     RecipeIngredient,
+    ShoppingListItem,
     Tag,
 )
-from users.models import User, Follow
+from users.models import Follow, User
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -48,12 +50,32 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         model = RecipeIngredient
 
 
+class ImageVariantsField(serializers.ReadOnlyField):
+    """URLs of the resized copies of the image:
+    {"thumbnail": {"webp": url, "jpeg": url}, "card": ..., "full": ...}.
+    """
+
+    def to_representation(self, value):
+        storage = Recipe._meta.get_field("image").storage
+        request = self.context.get("request")
+        urls = {}
+        for variant, names in value.items():
+            urls[variant] = {}
+            for encoder, name in names.items():
+                url = storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                urls[variant][encoder] = url
+        return urls
+
+
 class CartFavoriteRecipeSerializer(serializers.ModelSerializer):
     """Base serializer for Carts and Favorites."""
 
     id = serializers.PrimaryKeyRelatedField(source="recipe.id", read_only=True)
     name = serializers.CharField(source="recipe.name", read_only=True)
     image = serializers.ImageField(source="recipe.image", read_only=True)
+    images = ImageVariantsField(source="recipe.image_variants")
     cooking_time = serializers.IntegerField(
         source="recipe.cooking_time", read_only=True
     )
@@ -79,7 +101,7 @@ class FavoriteRecipeSerializer(CartFavoriteRecipeSerializer):
     """FavoriteRecipe model serializer."""
 
     class Meta:
-        fields = ("id", "name", "image", "cooking_time")
+        fields = ("id", "name", "image", "images", "cooking_time")
         read_only_fields = ("id", "name", "image", "cooking_time")
         model = FavoriteRecipe
 
@@ -88,20 +110,53 @@ class CartRecipeSerializer(CartFavoriteRecipeSerializer):
     """CartRecipe model serializer."""
 
     class Meta:
-        fields = ("id", "name", "image", "cooking_time")
+        fields = ("id", "name", "image", "images", "cooking_time")
         read_only_fields = ("id", "name", "image", "cooking_time")
         model = CartRecipe
 
 
+class ShoppingListItemSerializer(serializers.ModelSerializer):
+    """Aggregated ingredient in the user's shopping list serializer."""
+
+    id = serializers.IntegerField(source="ingredient.id")
+    name = serializers.CharField(source="ingredient.name")
+    measurement_unit = serializers.CharField(
+        source="ingredient.measurement_unit"
+    )
+
+    class Meta:
+        fields = ("id", "name", "measurement_unit", "amount")
+        model = ShoppingListItem
+
+
+class ShoppingListExportSerializer(serializers.ModelSerializer):
+    """Queued shopping list PDF serializer."""
+
+    url = serializers.HyperlinkedIdentityField(
+        view_name="api:shopping-lists-detail", lookup_field="digest"
+    )
+
+    class Meta:
+        fields = ("digest", "status", "url")
+        model = ShoppingListExport
+
+
 class Base64ImageField(serializers.ImageField):
-    """Base64ImageField serializer."""
+    """Base64ImageField serializer. Size and dimensions are checked
+    before the image is decoded, EXIF metadata is removed later with
+    the variants (see recipes.images.build_variants).
+    """
 
     def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith("data:image"):
-            format, imgstr = data.split(";base64,")
-            ext = format.split("/")[-1]
-
-            data = ContentFile(base64.b64decode(imgstr), name="temp." + ext)
+        try:
+            if isinstance(data, str) and data.startswith("data:image"):
+                data = images.decode_data_uri(data)
+            elif hasattr(data, "size"):
+                images.check_size(data.size)
+            if hasattr(data, "read"):
+                images.check_header(data)
+        except images.ImageError as error:
+            raise serializers.ValidationError(str(error))
 
         return super().to_internal_value(data)
 
@@ -109,9 +164,11 @@ class Base64ImageField(serializers.ImageField):
 class SmallRecipeSerializer(serializers.ModelSerializer):
     """Small Recipe model serializer for other serializers."""
 
+    images = ImageVariantsField(source="image_variants")
+
     class Meta:
         model = Recipe
-        fields = ("id", "name", "image", "cooking_time")
+        fields = ("id", "name", "image", "images", "cooking_time")
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -131,13 +188,8 @@ class UserSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
-        request = self.context["request"]
-        author = obj.id
-        user = request.user
-        return (
-            user.is_authenticated
-            and Follow.objects.filter(user=user, author=author).exists()
-        )
+        viewer = get_viewer_state(self.context)
+        return obj.id in viewer.following_ids
 
 
 class CreateUserSerializer(serializers.ModelSerializer):
@@ -200,6 +252,24 @@ class CreateUserSerializer(serializers.ModelSerializer):
         return user
 
 
+def get_recipes_limit(request):
+    """Value of the recipes_limit query parameter, None if not set."""
+    limit_size = request.query_params.get("recipes_limit", "")
+    return int(limit_size) if limit_size.isdigit() else None
+
+
+class FollowListSerializer(serializers.ListSerializer):
+    """Loads the latest recipes of all authors on the page at once."""
+
+    def to_representation(self, data):
+        follows = list(data.all() if hasattr(data, "all") else data)
+        self.context["recipes_by_author"] = Recipe.objects.latest_by_author(
+            [follow.author_id for follow in follows],
+            get_recipes_limit(self.context["request"]),
+        )
+        return super().to_representation(follows)
+
+
 class FollowSerializer(UserSerializer):
     """Follow model serializer."""
 
@@ -228,28 +298,24 @@ class FollowSerializer(UserSerializer):
             "recipes",
             "recipes_count",
         )
+        list_serializer_class = FollowListSerializer
 
     def get_recipes(self, obj):
-        limit_size = self.context["request"].query_params.get("recipes_limit")
-        if limit_size.isdigit():
-            recipes = Recipe.objects.filter(author=obj.author)[
-                : int(limit_size)
-            ]
+        recipes_by_author = self.context.get("recipes_by_author")
+        if recipes_by_author is not None:
+            recipes = recipes_by_author.get(obj.author_id, [])
         else:
-            recipes = Recipe.objects.filter(author=obj.author)
+            recipes = Recipe.objects.filter(author=obj.author_id)[
+                : get_recipes_limit(self.context["request"])
+            ]
         return SmallRecipeSerializer(recipes, many=True).data
 
     def get_is_subscribed(self, obj):
-        request = self.context["request"]
-        author = obj.author
-        user = request.user
-        return (
-            user.is_authenticated
-            and Follow.objects.filter(user=user, author=author).exists()
-        )
+        viewer = get_viewer_state(self.context)
+        return obj.author_id in viewer.following_ids
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.author).count()
+        return obj.author.recipes_count
 
     def validate(self, data):
         """Validates that new record is not already exist."""
@@ -281,6 +347,7 @@ class RecipeSerializer(serializers.ModelSerializer):
     is_in_shopping_cart = serializers.SerializerMethodField()
     author = UserSerializer(read_only=True)
     image = Base64ImageField(required=False, allow_null=True)
+    images = ImageVariantsField(source="image_variants")
 
     class Meta:
         fields = (
@@ -292,10 +359,12 @@ class RecipeSerializer(serializers.ModelSerializer):
             "is_in_shopping_cart",
             "name",
             "image",
+            "images",
+            "image_status",
             "text",
             "cooking_time",
         )
-        read_only_fields = ("id", "author")
+        read_only_fields = ("id", "author", "image_status")
         model = Recipe
 
     def get_tags(self, obj):
@@ -303,96 +372,162 @@ class RecipeSerializer(serializers.ModelSerializer):
         return TagSerializer(tags, many=True).data
 
     def get_ingredients(self, obj):
-        ingredients = RecipeIngredient.objects.filter(recipe=obj)
+        ingredients = getattr(obj, "ingredient_amounts", None)
+        if ingredients is None:
+            ingredients = obj.Amounts.select_related("ingredient")
         return RecipeIngredientSerializer(ingredients, many=True).data
 
     def get_is_favorited(self, obj):
-        request = self.context["request"]
-        recipe = obj.id
-        user = request.user
-        return (
-            user.is_authenticated
-            and FavoriteRecipe.objects.filter(
-                user=user, recipe=recipe
-            ).exists()
-        )
+        viewer = get_viewer_state(self.context)
+        return obj.id in viewer.favorite_ids
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context["request"]
-        recipe = obj.id
-        user = request.user
-        return (
-            user.is_authenticated
-            and CartRecipe.objects.filter(user=user, recipe=recipe).exists()
+        viewer = get_viewer_state(self.context)
+        return obj.id in viewer.cart_ids
+
+    def _set_ingredients(self, recipe, ingredients_data, created=False):
+        """Writes the recipe ingredients with bulk queries, touching only
+        the rows that actually changed, and applies the difference to the
+        shopping lists of the users who have the recipe in the cart.
+        """
+        amounts = {
+            item["ingredient"].id: item["amount"] for item in ingredients_data
+        }
+        existing = (
+            {} if created
+            else {row.ingredient_id: row for row in recipe.Amounts.all()}
+        )
+        before = {
+            ingredient_id: row.amount
+            for ingredient_id, row in existing.items()
+        }
+        removed = existing.keys() - amounts.keys()
+        if removed:
+            recipe.Amounts.filter(ingredient_id__in=removed).delete()
+        changed = []
+        for ingredient_id, row in existing.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ["amount"])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient_id=ingredient_id, amount=amount
+            )
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in existing
         )
+        # Nobody has a new recipe in the cart yet.
+        if not created:
+            shopping_list.change_recipe(
+                recipe.id, shopping_list.delta(before, amounts)
+            )
 
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            # Large decoded images live in temporary files, which the
+            # request does not know about.
+            image = self.validated_data.get("image")
+            if image:
+                image.close()
+
+    @transaction.atomic
     def create(self, validated_data):
         """Creates a new recipe instance, all validation in the separate
-        validate method (line 362).
+        validate method.
         """
-        tags_data = self.initial_data.get("tags", [])
-        ingredients_data = self.initial_data.get("ingredients", [])
-        recipe = Recipe.objects.create(**validated_data)
-        for tag_data in tags_data:
-            recipe.tags.add(tag_data)
-        for ingredient_data in ingredients_data:
-            ingredient_id = ingredient_data.get("id")
-            amount = ingredient_data.get("amount")
-            RecipeIngredient.objects.create(
-                recipe=recipe, ingredient_id=ingredient_id, amount=amount
-            )
+        tags_data = validated_data.pop("tags", [])
+        ingredients_data = validated_data.pop("ingredients", [])
+        recipe = Recipe.objects.create(
+            **validated_data, ingredients_count=len(ingredients_data)
+        )
+        recipe.tags.set(tags_data)
+        self._set_ingredients(recipe, ingredients_data, created=True)
+        if recipe.image:
+            images.schedule_variants(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        tags_data = self.initial_data.get("tags", [])
-        ingredients_data = self.initial_data.get("ingredients", [])
-        instance.tags.clear()
-        instance.ingredients.clear()
+        tags_data = validated_data.pop("tags", [])
+        ingredients_data = validated_data.pop("ingredients", [])
+        old_image = instance.image.name
+        instance.ingredients_count = len(ingredients_data)
         super().update(instance, validated_data)
-        for tag_data in tags_data:
-            instance.tags.add(tag_data)
-        for ingredient_data in ingredients_data:
-            ingredient_id = ingredient_data.get("id")
-            amount = ingredient_data.get("amount")
-            RecipeIngredient.objects.create(
-                recipe=instance, ingredient_id=ingredient_id, amount=amount
-            )
+        instance.tags.set(tags_data)
+        self._set_ingredients(instance, ingredients_data)
+        # Re-uploads of the same image resolve to the same stored file.
+        if instance.image.name != old_image:
+            images.schedule_variants(instance)
         return instance
 
     def validate(self, data):
-        """Validates all data in the recipe"""
-        tags = self.initial_data.get("tags", [])
+        """Validates all data in the recipe. Tags and ingredients are
+        resolved with one query each and passed on to create/update
+        as model instances.
+        """
+        try:
+            tags = [int(tag) for tag in self.initial_data.get("tags", [])]
+        except (TypeError, ValueError):
+            raise serializers.ValidationError(
+                detail={"tags": "Should be a list of tag IDs"}
+            )
         if len(tags) != len(set(tags)):
             raise serializers.ValidationError(
                 detail={"tags": "The tags in one recipe should be unique"}
             )
-        for tag in tags:
-            if not Tag.objects.filter(id=tag).exists():
-                raise serializers.ValidationError(
-                    detail={"tags": f"Tag with ID: {tag} does not exist"}
-                )
+        tags_found = Tag.objects.in_bulk(tags)
+        missing = [tag for tag in tags if tag not in tags_found]
+        if missing:
+            raise serializers.ValidationError(
+                detail={"tags": f"Tags with IDs: {missing} do not exist"}
+            )
 
         ingredients = self.initial_data.get("ingredients", [])
-        ingredients_in_recipe = []
+        amounts = {}
         for ingredient in ingredients:
-            ingredient_id = ingredient.get("id")
-            amount = ingredient.get("amount")
-            if ingredient_id in ingredients_in_recipe:
+            try:
+                ingredient_id = int(ingredient.get("id"))
+            except (TypeError, ValueError):
+                raise serializers.ValidationError(
+                    detail={"ingredient": "Should be an ingredient ID"}
+                )
+            if ingredient_id in amounts:
                 raise serializers.ValidationError(
                     detail={"ingredient": "Repeating ingredient"}
                 )
-            ingredients_in_recipe.append(ingredient_id)
-            if int(amount) < 1:
+            try:
+                amounts[ingredient_id] = int(ingredient.get("amount"))
+            except (TypeError, ValueError):
                 raise serializers.ValidationError(
-                    detail={"amount": "Should be 1 or more"}
+                    detail={"amount": "Should be a whole number"}
                 )
-            if not Ingredient.objects.filter(id=ingredient_id).exists():
+            if amounts[ingredient_id] < 1:
                 raise serializers.ValidationError(
-                    detail={
-                        "ingredient": (f"Ingredient with ID: "
-                                       f"{ingredient_id} does not exist")
-                    }
+                    detail={"amount": "Should be 1 or more"}
                 )
+        ingredients_found = Ingredient.objects.in_bulk(amounts)
+        missing = [
+            ingredient_id
+            for ingredient_id in amounts
+            if ingredient_id not in ingredients_found
+        ]
+        if missing:
+            raise serializers.ValidationError(
+                detail={
+                    "ingredient": (f"Ingredients with IDs: "
+                                   f"{missing} do not exist")
+                }
+            )
+        data["tags"] = [tags_found[tag] for tag in tags]
+        data["ingredients"] = [
+            {"ingredient": ingredients_found[ingredient_id], "amount": amount}
+            for ingredient_id, amount in amounts.items()
+        ]
 
         name = data["name"]
         if len(name) > settings.LIMIT_RECIPE_NAME:
@@ -406,3 +541,13 @@ class RecipeSerializer(serializers.ModelSerializer):
                 detail={"cooking_time": "Cooking time should be more than 0"}
             )
         return data
+
+
+class RecipeCoverageSerializer(RecipeSerializer):
+    """Recipe with the number of matched and missing ingredients."""
+
+    matched = serializers.IntegerField(read_only=True)
+    missing = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ("matched", "missing")
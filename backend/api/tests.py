@@ -0,0 +1,520 @@
+import base64
+import io
+import json
+import os
+import re
+from unittest import mock
+from urllib.parse import urlencode
+
+import reportlab
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from rest_framework.test import APIClient
+
+from api import utils
+from api.parsers import LimitedJSONParser, RequestTooLarge
+from recipes.models import (CartRecipe, FavoriteRecipe, Ingredient, Recipe,
+                            RecipeIngredient, Tag)
+from users.models import Follow, User
+
+
+class LimitedJSONParserTests(SimpleTestCase):
+    """Bodies over DATA_UPLOAD_MAX_MEMORY_SIZE are refused before they
+    are read.
+    """
+
+    def parse(self, body):
+        request = RequestFactory().post(
+            "/api/recipes/", body, content_type="application/json"
+        )
+        stream = io.BytesIO(body.encode())
+        return LimitedJSONParser().parse(
+            stream, parser_context={"request": request}
+        )
+
+    @override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=2000)
+    def test_oversized_body_is_refused_unread(self):
+        body = json.dumps({"image": "A" * 10000})
+        with self.assertRaises(RequestTooLarge):
+            self.parse(body)
+
+    @override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=2000)
+    def test_body_within_limit_is_parsed(self):
+        self.assertEqual(self.parse('{"name": "x"}'), {"name": "x"})
+
+
+class RecipeListQueriesTests(TestCase):
+    """A recipe page is served with the same number of queries whatever
+    its size.
+    """
+
+    # count, page, tags, ingredient amounts, and the viewer's favorites,
+    # cart and subscriptions.
+    LIST_QUERIES = 7
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email="author@example.com",
+            username="author",
+            password="password",
+            first_name="Author",
+            last_name="Author",
+        )
+        cls.viewer = User.objects.create_user(
+            email="viewer@example.com",
+            username="viewer",
+            password="password",
+            first_name="Viewer",
+            last_name="Viewer",
+        )
+        Follow.objects.create(user=cls.viewer, author=cls.author)
+        tags = [
+            Tag.objects.create(name=f"tag{i}", slug=f"tag{i}", color="#000")
+            for i in range(2)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f"ingredient{i}",
+                                      measurement_unit="g")
+            for i in range(3)
+        ]
+        for i in range(50):
+            recipe = Recipe.objects.create(
+                author=cls.author, name=f"recipe{i}", text="text",
+                cooking_time=5,
+            )
+            recipe.tags.set(tags)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=1
+                )
+                for ingredient in ingredients
+            )
+            if i % 2:
+                FavoriteRecipe.objects.create(user=cls.viewer, recipe=recipe)
+            if i % 3:
+                CartRecipe.objects.create(user=cls.viewer, recipe=recipe)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def test_query_count_is_flat(self):
+        for limit in (6, 50):
+            with self.subTest(limit=limit):
+                with self.assertNumQueries(self.LIST_QUERIES):
+                    response = self.client.get(
+                        "/api/recipes/", {"limit": limit}
+                    )
+                self.assertEqual(response.status_code, 200)
+                results = response.json()["results"]
+                self.assertEqual(len(results), limit)
+                self.assertEqual(len(results[0]["tags"]), 2)
+                self.assertEqual(len(results[0]["ingredients"]), 3)
+                self.assertTrue(results[0]["author"]["is_subscribed"])
+
+
+class ShoppingCartDownloadErrorsTests(TestCase):
+    """Errors of the download are JSON whatever format was negotiated."""
+
+    def test_anonymous_gets_json_401(self):
+        for params in ({}, {"format": "pdf"}, {"format": "csv"}):
+            with self.subTest(params=params):
+                response = APIClient().get(
+                    "/api/recipes/download_shopping_cart/", params
+                )
+                self.assertEqual(response.status_code, 401)
+                self.assertEqual(
+                    response["Content-Type"], "application/json"
+                )
+                self.assertIn("detail", response.json())
+
+
+class RecipeSearchTests(TestCase):
+    """?search= on the substring fallback used outside PostgreSQL."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email="author@example.com",
+            username="author",
+            password="password",
+            first_name="Author",
+            last_name="Author",
+        )
+        for name, text in (
+            ("Борщ красный", "Свёкла и капуста."),
+            ("Суп", "Почти как БОРЩ, только без свёклы."),
+            ("Каша", "Гречка."),
+            ("Борщ зелёный", "Щавель."),
+        ):
+            Recipe.objects.create(
+                author=author, name=name, text=text, cooking_time=5
+            )
+
+    def search(self, **params):
+        response = APIClient().get(
+            "/api/recipes/", {"search": "борщ", **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_name_matches_rank_before_text_matches(self):
+        names = [recipe["name"] for recipe in self.search()["results"]]
+        self.assertEqual(names, ["Борщ зелёный", "Борщ красный", "Суп"])
+
+    def test_cursor_keeps_ranked_page_numbers(self):
+        page = self.search(cursor="", limit=2)
+        self.assertEqual(page["count"], 3)
+        self.assertEqual(
+            [recipe["name"] for recipe in page["results"]],
+            ["Борщ зелёный", "Борщ красный"],
+        )
+        self.assertIn("page=2", page["next"])
+        page = self.search(cursor="", limit=2, page=2)
+        self.assertEqual(
+            [recipe["name"] for recipe in page["results"]], ["Суп"]
+        )
+
+
+class RecipeWriteQueriesTests(TestCase):
+    """Recipe ingredients are written with bulk queries: the number of
+    queries does not depend on how many ingredients the recipe has.
+    """
+
+    # tags and ingredients lookups, savepoint, recipe insert, author
+    # counter, fan-out (flag and followers), tags, one ingredients
+    # insert, release, and the response.
+    CREATE_QUERIES = 16
+    # recipe, its author, tags and ingredients lookups, savepoint,
+    # recipe update, tags, current rows, one delete, one update and one
+    # insert, cart holders in a savepoint, release, and the response.
+    UPDATE_QUERIES = 20
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            email="author@example.com",
+            username="author",
+            password="password",
+            first_name="Author",
+            last_name="Author",
+        )
+        cls.tag = Tag.objects.create(name="tag", slug="tag", color="#000")
+        cls.ingredients = [
+            Ingredient.objects.create(name=f"ingredient{i}",
+                                      measurement_unit="g")
+            for i in range(40)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def data(self, amounts):
+        return {
+            "name": "recipe",
+            "text": "text",
+            "cooking_time": 5,
+            "tags": [self.tag.id],
+            "ingredients": [
+                {"id": self.ingredients[i].id, "amount": amount}
+                for i, amount in amounts.items()
+            ],
+        }
+
+    def test_create(self):
+        for size in (1, 10, 30):
+            with self.subTest(size=size):
+                with self.assertNumQueries(self.CREATE_QUERIES):
+                    response = self.client.post(
+                        "/api/recipes/",
+                        self.data(dict.fromkeys(range(size), 1)),
+                        format="json",
+                    )
+                self.assertEqual(response.status_code, 201)
+
+    def test_update_writes_only_the_difference(self):
+        for size in (1, 5):
+            with self.subTest(size=size):
+                amounts = dict.fromkeys(range(30), 1)
+                response = self.client.post(
+                    "/api/recipes/", self.data(amounts), format="json"
+                )
+                pk = response.json()["id"]
+                for i in range(size):
+                    del amounts[i]
+                    amounts[size + i] = 2
+                    amounts[30 + i] = 3
+                with self.assertNumQueries(self.UPDATE_QUERIES):
+                    response = self.client.patch(
+                        f"/api/recipes/{pk}/",
+                        self.data(amounts),
+                        format="json",
+                    )
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    dict(
+                        RecipeIngredient.objects.filter(
+                            recipe_id=pk
+                        ).values_list("ingredient_id", "amount")
+                    ),
+                    {
+                        self.ingredients[i].id: amount
+                        for i, amount in amounts.items()
+                    },
+                )
+
+
+# freesans.ttf comes with the collected static files, the tests draw with
+# the Vera font bundled with ReportLab.
+TEST_FONT_FILE = os.path.join(
+    os.path.dirname(reportlab.__file__), "fonts", "Vera.ttf"
+)
+
+
+@override_settings(
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache"
+        }
+    }
+)
+@mock.patch.object(utils, "FONT_FILE", TEST_FONT_FILE)
+class ShoppingListPDFTests(SimpleTestCase):
+    """api.utils renders shopping lists of any length and caches them."""
+
+    def setUp(self):
+        utils.register_font.cache_clear()
+
+    def ingredients(self, count, amount=1):
+        return [
+            {
+                "ingredient__name": f"ingredient{i}",
+                "ingredient__measurement_unit": "g",
+                "total_amount": amount,
+            }
+            for i in range(count)
+        ]
+
+    def test_long_lists_span_pages(self):
+        document = utils.render_shopping_list(self.ingredients(1000))
+        pages = len(re.findall(rb"/Type /Page\b(?!s)", document))
+        # 27 lines under the title, then 31 per page.
+        self.assertEqual(pages, 1 + -(-(1000 - 27) // 31))
+
+    def test_font_is_registered_once(self):
+        with mock.patch.object(utils, "TTFont", wraps=utils.TTFont) as font:
+            for _ in range(3):
+                utils.render_shopping_list(self.ingredients(2))
+        font.assert_called_once_with(
+            utils.FONT_NAME, TEST_FONT_FILE, "UTF-8"
+        )
+
+    def test_unchanged_lists_skip_reportlab(self):
+        with mock.patch.object(
+            utils, "render_shopping_list", wraps=utils.render_shopping_list
+        ) as render:
+            first = utils.prepare_shopping_list(self.ingredients(5))
+            again = utils.prepare_shopping_list(self.ingredients(5))
+            self.assertEqual(render.call_count, 1)
+            self.assertEqual(first.read(), again.read())
+            utils.prepare_shopping_list(self.ingredients(5, amount=2))
+            self.assertEqual(render.call_count, 2)
+
+
+class KeysetPaginationTests(TestCase):
+    """?cursor= pages follow the whole key, so rows sharing a pub_date
+    are neither skipped nor repeated.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                email=f"user{i}@example.com",
+                username=f"user{i}",
+                password="password",
+                first_name=f"User{i}",
+                last_name=f"User{i}",
+            )
+            for i in range(6)
+        ]
+        cls.viewer = cls.users[0]
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.users[1], name=f"recipe{i}", text="text",
+                cooking_time=5,
+            )
+            for i in range(7)
+        ]
+        # Two groups of recipes published at the same instant.
+        Recipe.objects.filter(pk__in=[r.pk for r in cls.recipes[:4]]).update(
+            pub_date=cls.recipes[0].pub_date
+        )
+        Recipe.objects.filter(pk__in=[r.pk for r in cls.recipes[4:]]).update(
+            pub_date=cls.recipes[4].pub_date
+        )
+        for author in cls.users[:0:-1]:
+            Follow.objects.create(user=cls.viewer, author=author)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def walk(self, url, key):
+        pages = []
+        params = {"cursor": "", "limit": 2}
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertNotIn("count", data)
+            self.assertIsNone(data["previous"])
+            pages.append([row[key] for row in data["results"]])
+            url, params = data["next"], None
+        return pages
+
+    def test_recipes_with_equal_pub_dates(self):
+        names = [recipe.name for recipe in self.recipes[::-1]]
+        self.assertEqual(
+            self.walk("/api/recipes/", "name"),
+            [names[0:2], names[2:4], names[4:6], names[6:]],
+        )
+
+    def test_subscriptions_are_keyed_on_id(self):
+        # Followed last to first, the newest subscription comes first.
+        ids = [user.id for user in self.users[1:]]
+        self.assertEqual(
+            self.walk("/api/users/subscriptions/", "id"),
+            [ids[0:2], ids[2:4], ids[4:]],
+        )
+
+    def test_tampered_cursor_is_not_found(self):
+        for position in (
+            "not json",
+            json.dumps({"pub_date": "2020-01-01"}),
+            json.dumps(["2020-01-01T00:00:00"]),
+            json.dumps(["yesterday", 1]),
+            json.dumps(["2020-01-01T00:00:00", None]),
+        ):
+            cursor = base64.b64encode(
+                urlencode({"p": position}).encode()
+            ).decode()
+            with self.subTest(position=position):
+                response = self.client.get(
+                    "/api/recipes/", {"cursor": cursor}
+                )
+                self.assertEqual(response.status_code, 404)
+        response = self.client.get("/api/recipes/", {"cursor": "@@@"})
+        self.assertEqual(response.status_code, 404)
+
+
+class TagsFilterTests(TestCase):
+    """?tags= keeps recipes with any of the tags, or all of them with
+    ?tags_mode=all, and lists each recipe once.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            email="author@example.com",
+            username="author",
+            password="password",
+            first_name="Author",
+            last_name="Author",
+        )
+        tags = {
+            slug: Tag.objects.create(name=slug, slug=slug, color="#000")
+            for slug in ("breakfast", "lunch", "dinner")
+        }
+        for name, slugs in (
+            ("porridge", ("breakfast",)),
+            ("soup", ("lunch", "dinner")),
+            ("omelette", ("breakfast", "lunch", "dinner")),
+            ("steak", ("dinner",)),
+        ):
+            recipe = Recipe.objects.create(
+                author=author, name=name, text="text", cooking_time=5
+            )
+            recipe.tags.set(tags[slug] for slug in slugs)
+
+    def names(self, tags, **params):
+        response = APIClient().get(
+            "/api/recipes/", {"tags": tags, "limit": 10, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        names = [recipe["name"] for recipe in data["results"]]
+        self.assertEqual(data["count"], len(names))
+        return names
+
+    def test_any_of_the_tags(self):
+        for params in ({}, {"tags_mode": "any"}):
+            with self.subTest(params=params):
+                self.assertEqual(
+                    self.names(["lunch", "dinner"], **params),
+                    ["steak", "omelette", "soup"],
+                )
+
+    def test_all_of_the_tags(self):
+        self.assertEqual(
+            self.names(["lunch", "dinner"], tags_mode="all"),
+            ["omelette", "soup"],
+        )
+        self.assertEqual(
+            self.names(["breakfast", "dinner"], tags_mode="all"),
+            ["omelette"],
+        )
+
+    def test_unknown_tags_match_nothing(self):
+        self.assertEqual(self.names(["brunch"]), [])
+        self.assertEqual(
+            self.names(["lunch", "brunch"], tags_mode="all"), []
+        )
+
+
+@override_settings(
+    INGREDIENT_AUTOCOMPLETE_LIMIT=4,
+    CACHES={
+        "default": {
+            "BACKEND": "django.core.cache.backends.dummy.DummyCache"
+        }
+    },
+)
+class IngredientAutocompleteTests(TestCase):
+    """The database and the in-memory index answer ?name= alike: exact
+    match first, then shorter names, at most INGREDIENT_AUTOCOMPLETE_LIMIT
+    of them.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in (
+            "salted butter",
+            "salt flakes",
+            "sea salt",
+            "saltpeter",
+            "Salt",
+            "salmon",
+            "salt",
+        ):
+            Ingredient.objects.create(name=name, measurement_unit="g")
+
+    def names(self, name):
+        response = APIClient().get("/api/ingredients/", {"name": name})
+        self.assertEqual(response.status_code, 200)
+        return [ingredient["name"] for ingredient in response.json()]
+
+    def test_exact_match_first_and_capped(self):
+        for index in (False, True):
+            with self.subTest(index=index):
+                with self.settings(INGREDIENT_INDEX=index):
+                    self.assertEqual(
+                        self.names("SALT"),
+                        ["Salt", "salt", "saltpeter", "salt flakes"],
+                    )
+                    self.assertEqual(
+                        self.names("sal"),
+                        ["Salt", "salt", "salmon", "saltpeter"],
+                    )
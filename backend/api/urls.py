@@ -1,8 +1,8 @@
 from django.urls import include, path
 from rest_framework import routers
 
-from api.views import (FollowViewSet, IngredientViewSet, RecipeViewSet,
-                       TagViewSet)
+from api.views import (FeedViewSet, FollowViewSet, IngredientViewSet,
+                       RecipeViewSet, ShoppingListExportViewSet, TagViewSet)
 
 app_name = "api"
 
@@ -11,6 +11,10 @@ router_v1.register(r"recipes", RecipeViewSet)
 router_v1.register(r"tags", TagViewSet)
 router_v1.register(r"ingredients", IngredientViewSet)
 router_v1.register(r"users/subscriptions", FollowViewSet, basename="following")
+router_v1.register(r"feed", FeedViewSet, basename="feed")
+router_v1.register(
+    r"shopping-lists", ShoppingListExportViewSet, basename="shopping-lists"
+)
 
 category_detail = FollowViewSet.as_view(
     {
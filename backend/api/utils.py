@@ -1,40 +1,130 @@
+import csv
+import functools
+import hashlib
 import io
+import json
 
+from django.conf import settings
+from django.core.cache import cache
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen import canvas
 
+FONT_NAME = "FreeSans"
+FONT_FILE = "foodgram_static/freesans.ttf"
+LINE_HEIGHT = 25
+PAGE_TOP = 800
+PAGE_BOTTOM = 50
 
-def prepare_shopping_list(ingredients):
-    """Transforms queryset of ingredients to a BytesIO object
-    with the shopping list.
+
+@functools.lru_cache(maxsize=None)
+def register_font():
+    """Parses the TTF file once per process."""
+    pdfmetrics.registerFont(
+        TTFont(FONT_NAME, FONT_FILE, "UTF-8")
+    )
+
+
+def _line(num, ingredient):
+    return (
+        f"{num}) {ingredient['ingredient__name']} "
+        f"{ingredient['total_amount']} "
+        f"{ingredient['ingredient__measurement_unit']}"
+    )
+
+
+def render_shopping_list(ingredients):
+    """Draws the shopping list on as many pages as it needs and returns
+    the PDF bytes.
     """
+    register_font()
     buffer = io.BytesIO()
     p = canvas.Canvas(buffer)
-    pdfmetrics.registerFont(
-        TTFont("FreeSans", "foodgram_static/freesans.ttf", "UTF-8")
-    )
-    p.setFont("FreeSans", 24)
+    p.setFont(FONT_NAME, 24)
     p.setFillColorRGB(0, 0, 255)
     p.drawString(50, 770, "ИНГРЕДИЕНТЫ для покупки")
     p.setFillColorRGB(0, 0, 0)
-    p.setFont("FreeSans", 14)
+    p.setFont(FONT_NAME, 14)
     p.drawString(50, 750, "(на основе рецептов в вашей корзине)")
     p.line(10, 725, 550, 725)
     pos_y = 700
     for num, ingredient in enumerate(ingredients, start=1):
-        p.drawString(
-            50,
-            pos_y,
-            (
-                f"{num}) {ingredient['ingredient__name']} "
-                f"{ingredient['total_amount']} "
-                f"{ingredient['ingredient__measurement_unit']}"
-            ),
-        )
-        pos_y -= 25
+        if pos_y < PAGE_BOTTOM:
+            p.showPage()
+            p.setFont(FONT_NAME, 14)
+            pos_y = PAGE_TOP
+        p.drawString(50, pos_y, _line(num, ingredient))
+        pos_y -= LINE_HEIGHT
     p.line(10, pos_y, 550, pos_y)
     p.showPage()
     p.save()
-    buffer.seek(0)
-    return buffer
+    return buffer.getvalue()
+
+
+def shopping_list_digest(ingredients):
+    """SHA-256 of the aggregated ingredients, identifies the document."""
+    return hashlib.sha256(
+        json.dumps(ingredients, ensure_ascii=False, default=str).encode()
+    ).hexdigest()
+
+
+def prepare_shopping_list(ingredients):
+    """Transforms queryset of ingredients to a BytesIO object
+    with the shopping list. Rendered documents are cached by their
+    content, so unchanged lists skip ReportLab.
+    """
+    ingredients = list(ingredients)
+    key = f"shopping-list-pdf:{shopping_list_digest(ingredients)}"
+    document = cache.get(key)
+    if document is None:
+        document = render_shopping_list(ingredients)
+        cache.set(key, document, settings.SHOPPING_LIST_CACHE_TIMEOUT)
+    return io.BytesIO(document)
+
+
+def stream_shopping_list_text(ingredients):
+    yield "ИНГРЕДИЕНТЫ для покупки\n\n"
+    for num, ingredient in enumerate(ingredients, start=1):
+        yield _line(num, ingredient) + "\n"
+
+
+class _Echo:
+    """File-like object that returns what csv.writer writes to it."""
+
+    def write(self, value):
+        return value
+
+
+def stream_shopping_list_csv(ingredients):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(("name", "measurement_unit", "amount"))
+    for ingredient in ingredients:
+        yield writer.writerow(
+            (
+                ingredient["ingredient__name"],
+                ingredient["ingredient__measurement_unit"],
+                ingredient["total_amount"],
+            )
+        )
+
+
+def stream_shopping_list_json(ingredients):
+    yield "["
+    for num, ingredient in enumerate(ingredients):
+        item = json.dumps(
+            {
+                "name": ingredient["ingredient__name"],
+                "measurement_unit": ingredient["ingredient__measurement_unit"],
+                "amount": ingredient["total_amount"],
+            },
+            ensure_ascii=False,
+        )
+        yield f",{item}" if num else item
+    yield "]"
+
+
+SHOPPING_LIST_STREAMS = {
+    "txt": stream_shopping_list_text,
+    "csv": stream_shopping_list_csv,
+    "json": stream_shopping_list_json,
+}
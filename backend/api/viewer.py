@@ -0,0 +1,46 @@
+from django.utils.functional import cached_property
+
+from recipes.models import CartRecipe, FavoriteRecipe
+from users.models import Follow
+
+
+class ViewerState:
+    """IDs of the recipes and authors the current user has marked.
+
+    Every set is loaded with a single query the first time it is needed
+    and then answers the flags of all objects on the page from memory.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    def _ids(self, model, field):
+        if not self.user.is_authenticated:
+            return frozenset()
+        return frozenset(
+            model.objects.filter(user=self.user).values_list(field, flat=True)
+        )
+
+    @cached_property
+    def favorite_ids(self):
+        return self._ids(FavoriteRecipe, "recipe_id")
+
+    @cached_property
+    def cart_ids(self):
+        return self._ids(CartRecipe, "recipe_id")
+
+    @cached_property
+    def following_ids(self):
+        return self._ids(Follow, "author_id")
+
+
+def get_viewer_state(context):
+    """Returns the viewer state from the serializer context, creating it
+    once per request if the view did not pass one in.
+    """
+    if "viewer_state" in context:
+        return context["viewer_state"]
+    request = context["request"]
+    if not hasattr(request, "viewer_state"):
+        request.viewer_state = ViewerState(request.user)
+    return request.viewer_state
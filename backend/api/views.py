@@ -1,25 +1,34 @@
-from django.db.models import Sum
-from django.http import FileResponse
+from django.conf import settings
+from django.db.models import F
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework import status, viewsets
+from rest_framework import mixins, serializers, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
 from api.filters import IngredientSearchFilter, RecipeFilter
-from api.paginator import RecipesPagination
-from api.utils import prepare_shopping_list
+from api.mixins import CachedReferenceMixin, ConditionalRecipeMixin
+from api.models import ShoppingListExport
+from api.paginator import FeedPagination, RecipesPagination
 from api.permissions import IsOwnerAdminOrReadOnly
+from api.renderers import CSVRenderer, PDFRenderer, PlainTextRenderer
+from api.utils import (SHOPPING_LIST_STREAMS, prepare_shopping_list,
+                       shopping_list_digest)
 from api.serializers import (CartRecipeSerializer, FavoriteRecipeSerializer,
                              FollowSerializer, IngredientSerializer,
-                             RecipeSerializer, TagSerializer)
+                             RecipeCoverageSerializer, RecipeSerializer,
+                             ShoppingListExportSerializer,
+                             ShoppingListItemSerializer, TagSerializer)
+from recipes.feed import Feed
 from recipes.models import (CartRecipe, FavoriteRecipe, Ingredient, Recipe,
-                            RecipeIngredient, Tag)
+                            ShoppingListItem, Tag)
 from users.models import Follow, User
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ConditionalRecipeMixin, viewsets.ModelViewSet):
     """Recipes API endpoint."""
 
     http_method_names = ["get", "post", "patch", "delete"]
@@ -30,12 +39,29 @@ class RecipeViewSet(viewsets.ModelViewSet):
     filterset_class = RecipeFilter
     pagination_class = RecipesPagination
 
+    def get_queryset(self):
+        if self.action in ("list", "retrieve"):
+            return Recipe.objects.for_listing()
+        return Recipe.objects.all()
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
     def perform_update(self, serializer):
         serializer.save(author=self.request.user)
 
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Errors of download_shopping_cart (401, throttling...) would be
+        # rendered by the negotiated file renderer, PDF by default.
+        if (
+            self.action == "download_shopping_cart"
+            and isinstance(response, Response)
+            and not status.is_success(response.status_code)
+        ):
+            request.accepted_renderer = JSONRenderer()
+            request.accepted_media_type = JSONRenderer.media_type
+        return super().finalize_response(request, response, *args, **kwargs)
+
     @action(
         detail=True,
         methods=["post"],
@@ -90,23 +116,117 @@ class RecipeViewSet(viewsets.ModelViewSet):
         detail=False,
         methods=["get"],
         permission_classes=[IsAuthenticated],
+        renderer_classes=[
+            PDFRenderer,
+            PlainTextRenderer,
+            CSVRenderer,
+            JSONRenderer,
+        ],
     )
     def download_shopping_cart(self, request):
+        """Shopping list as PDF (default), txt, csv or json, chosen with
+        ?format= or the Accept header. Text formats are streamed.
+        """
         ingredients = (
-            RecipeIngredient.objects.filter(
-                recipe__ShoppingCart__user=request.user
+            ShoppingListItem.objects.filter(user=request.user)
+            .values(
+                "ingredient__name",
+                "ingredient__measurement_unit",
+                total_amount=F("amount"),
+            )
+            .order_by("-amount")
+        )
+        renderer = request.accepted_renderer
+        if renderer.format == "pdf" and settings.SHOPPING_LIST_ASYNC:
+            return self._queue_shopping_list(request, list(ingredients))
+        if renderer.format == "pdf":
+            buffer = prepare_shopping_list(ingredients)
+            return FileResponse(
+                buffer, as_attachment=True, filename="shopping-list.pdf"
             )
-            .values("ingredient__name", "ingredient__measurement_unit")
-            .annotate(total_amount=Sum("amount"))
-            .order_by("-total_amount")
+        response = StreamingHttpResponse(
+            SHOPPING_LIST_STREAMS[renderer.format](ingredients.iterator()),
+            content_type=f"{renderer.media_type}; charset=utf-8",
         )
-        buffer = prepare_shopping_list(ingredients)
-        return FileResponse(
-            buffer, as_attachment=True, filename="shopping-list.pdf"
+        response["Content-Disposition"] = (
+            f'attachment; filename="shopping-list.{renderer.format}"'
         )
+        return response
 
+    def _queue_shopping_list(self, request, ingredients):
+        """Queues the PDF for the render_shopping_lists worker, identical
+        lists share one job.
+        """
+        export, created = ShoppingListExport.objects.get_or_create(
+            digest=shopping_list_digest(ingredients),
+            defaults={"content": ingredients},
+        )
+        if (
+            export.status == ShoppingListExport.Status.FAILED
+            or export.is_stale
+        ):
+            export.status = ShoppingListExport.Status.PENDING
+            export.save(update_fields=["status", "updated"])
+        serializer = ShoppingListExportSerializer(
+            export, context=self.get_serializer_context()
+        )
+        # The negotiated renderer is the PDF one, answer with plain JSON.
+        return JsonResponse(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+    @action(
+        detail=False,
+        methods=["get"],
+        serializer_class=RecipeCoverageSerializer,
+        filter_backends=(),
+    )
+    def by_ingredients(self, request):
+        """Recipes that can be cooked from ?ingredients=1,2,3, the ones
+        with the fewest missing ingredients first.
+        """
+        ingredient_ids = set()
+        for value in request.query_params.getlist("ingredients"):
+            for ingredient_id in value.split(","):
+                try:
+                    ingredient_ids.add(int(ingredient_id))
+                except ValueError:
+                    raise serializers.ValidationError(
+                        detail={"ingredients": "Should be a list of IDs"}
+                    )
+        if not ingredient_ids:
+            raise serializers.ValidationError(
+                detail={"ingredients": "At least one ingredient is required"}
+            )
+        if len(ingredient_ids) > settings.RECIPES_BY_INGREDIENTS_MAX:
+            raise serializers.ValidationError(
+                detail={
+                    "ingredients": (
+                        f"No more than {settings.RECIPES_BY_INGREDIENTS_MAX} "
+                        "ingredients at once"
+                    )
+                }
+            )
+        queryset = Recipe.objects.for_listing().by_ingredients(ingredient_ids)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
-class TagViewSet(viewsets.ModelViewSet):
+    @action(
+        detail=False,
+        methods=["get"],
+        permission_classes=[IsAuthenticated],
+        pagination_class=None,
+    )
+    def shopping_list(self, request):
+        items = (
+            ShoppingListItem.objects.filter(user=request.user)
+            .select_related("ingredient")
+            .order_by("-amount")
+        )
+        serializer = ShoppingListItemSerializer(items, many=True)
+        return Response(serializer.data)
+
+
+class TagViewSet(CachedReferenceMixin, viewsets.ModelViewSet):
     """Tags API endpoint."""
 
     http_method_names = ["get"]
@@ -114,9 +234,10 @@ class TagViewSet(viewsets.ModelViewSet):
     serializer_class = TagSerializer
     permission_classes = [AllowAny]
     pagination_class = None
+    cache_models = (Tag,)
 
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(CachedReferenceMixin, viewsets.ModelViewSet):
     """Ingredients API endpoint."""
 
     http_method_names = ["get"]
@@ -125,7 +246,7 @@ class IngredientViewSet(viewsets.ModelViewSet):
     permission_classes = [AllowAny]
     pagination_class = None
     filter_backends = (IngredientSearchFilter,)
-    search_fields = ("^name",)
+    cache_models = (Ingredient,)
 
 
 class FollowViewSet(viewsets.ModelViewSet):
@@ -135,6 +256,7 @@ class FollowViewSet(viewsets.ModelViewSet):
     serializer_class = FollowSerializer
     permission_classes = [IsAuthenticated]
     pagination_class = RecipesPagination
+    keyset_fields = ("id",)
 
     def _get_author(self):
         author_id = self.kwargs.get("user_id")
@@ -142,7 +264,7 @@ class FollowViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        return user.follower.all()
+        return user.follower.select_related("author")
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -162,3 +284,35 @@ class FollowViewSet(viewsets.ModelViewSet):
         )
         model_obj.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ShoppingListExportViewSet(viewsets.GenericViewSet):
+    """Queued shopping list PDFs API endpoint."""
+
+    queryset = ShoppingListExport.objects.all()
+    serializer_class = ShoppingListExportSerializer
+    permission_classes = [IsAuthenticated]
+    lookup_field = "digest"
+
+    def retrieve(self, request, *args, **kwargs):
+        export = self.get_object()
+        if export.status == ShoppingListExport.Status.DONE:
+            return FileResponse(
+                export.file.open("rb"),
+                as_attachment=True,
+                filename="shopping-list.pdf",
+            )
+        serializer = self.get_serializer(export)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+
+
+class FeedViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
+    """Recipes of the followed authors API endpoint."""
+
+    serializer_class = RecipeSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = FeedPagination
+    filter_backends = ()
+
+    def get_queryset(self):
+        return Feed(self.request.user)
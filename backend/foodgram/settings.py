@@ -1,4 +1,5 @@
 import os
+import tempfile
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -76,6 +77,21 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION',
+            os.path.join(tempfile.gettempdir(), 'foodgram_cache'),
+        ),
+        # Versions, autocomplete results, counts and rendered PDFs share
+        # this cache, the default of 300 entries is culled constantly.
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 10000)),
+        },
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -109,6 +125,18 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+RECIPE_IMAGE_MAX_SIZE = int(
+    os.getenv('RECIPE_IMAGE_MAX_SIZE', 10 * 1024 * 1024)
+)
+# Recipes are posted as JSON with a base64 image: 4/3 of the image size
+# plus the rest of the recipe. Larger JSON and form bodies are refused
+# from their Content-Length by api.parsers before they are read.
+DATA_UPLOAD_MAX_MEMORY_SIZE = RECIPE_IMAGE_MAX_SIZE * 4 // 3 + 1024 * 1024
+RECIPE_IMAGE_MAX_DIMENSION = 8000
+RECIPE_IMAGES_ASYNC = os.getenv('RECIPE_IMAGES_ASYNC') == 'True'
+# Seconds before a recipe left processing by a dead worker is queued again
+RECIPE_IMAGE_JOB_TIMEOUT = 10 * 60
+
 AUTH_USER_MODEL = 'users.User'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -122,6 +150,12 @@ REST_FRAMEWORK = {
         'rest_framework.authentication.TokenAuthentication',
     ],
 
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.LimitedJSONParser',
+        'api.parsers.LimitedFormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
 
@@ -144,3 +178,20 @@ DJOSER = {
 
 LIMIT_STRINGS = 150
 LIMIT_RECIPE_NAME = 200
+INGREDIENT_AUTOCOMPLETE_LIMIT = 30
+INGREDIENT_INDEX = os.getenv('INGREDIENT_INDEX') == 'True'
+RECIPES_BY_INGREDIENTS_MAX = 50
+RECIPES_BY_INGREDIENTS_CANDIDATES = 1000
+REFERENCE_CACHE_TIMEOUT = 60 * 60 * 24
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60
+SHOPPING_LIST_ASYNC = os.getenv('SHOPPING_LIST_ASYNC') == 'True'
+# Seconds before a job left processing by a dead worker is queued again
+SHOPPING_LIST_JOB_TIMEOUT = 10 * 60
+# Seconds rendered shopping list exports are kept
+SHOPPING_LIST_EXPORT_TTL = 60 * 60 * 24
+# exact, cached or estimated, see api.paginator.CountingPaginator
+RECIPES_COUNT_STRATEGY = os.getenv('RECIPES_COUNT_STRATEGY', 'exact')
+RECIPES_COUNT_CACHE_TIMEOUT = 60
+RECIPES_COUNT_ESTIMATE_MIN = 10000
+FEED_MAX_ENTRIES = 500
+FEED_FANOUT_MAX_FOLLOWERS = 10000
@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.INGREDIENT_INDEX:
+    from api.autocomplete import ingredient_index
+
+    ingredient_index.warm()
@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from . import shopping_list
 from .models import (CartRecipe, FavoriteRecipe, Ingredient, Recipe,
                      RecipeIngredient, Tag)
 
@@ -27,7 +28,23 @@ class RecipeAdmin(admin.ModelAdmin):
     ]
 
     def in_favorites_times(self, obj):
-        return f"{obj.Users.all().count()} users like this"
+        return f"{obj.favorites_count} users like this"
+
+    def save_related(self, request, form, formsets, change):
+        """Applies the ingredient changes of the inline to the shopping
+        lists, once for the whole recipe, and stores the new count.
+        """
+        recipe = form.instance
+        before = shopping_list.recipe_amounts(recipe.pk) if change else {}
+        super().save_related(request, form, formsets, change)
+        after = shopping_list.recipe_amounts(recipe.pk)
+        Recipe.objects.filter(pk=recipe.pk).update(
+            ingredients_count=len(after)
+        )
+        if change:
+            shopping_list.change_recipe(
+                recipe.pk, shopping_list.delta(before, after)
+            )
 
 
 class IngredientAdmin(admin.ModelAdmin):
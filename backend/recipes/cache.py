@@ -0,0 +1,40 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def _version_key(model, scope=None):
+    key = f"version:{model._meta.label_lower}"
+    return key if scope is None else f"{key}:{scope}"
+
+
+def get_version(model, scope=None):
+    """Returns the current data version of the model, shared by all
+    processes through the configured cache. `scope` narrows it down to
+    a part of the data, e.g. the rows of one user.
+    """
+    key = _version_key(model, scope)
+    version = cache.get(key)
+    if version is None:
+        version = time.time_ns()
+        cache.add(key, version, None)
+        version = cache.get(key, version)
+    return version
+
+
+def bump_version(model, scope=None):
+    """Marks all cached data derived from the model as stale.
+
+    A plain set of a fresh timestamp rather than incr: incr is a
+    read-modify-write on some backends (FileBasedCache) and concurrent
+    bumps could settle on a version that is already in use.
+    """
+    cache.set(_version_key(model, scope), time.time_ns(), None)
+
+
+def bump_version_on_commit(model, scope=None):
+    """Bumps the version once the current transaction is committed, so
+    a new version is never paired with the old data.
+    """
+    transaction.on_commit(lambda: bump_version(model, scope))
@@ -0,0 +1,42 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import (CartRecipe, FavoriteRecipe, Recipe,
+                            RecipeIngredient)
+from users.models import Follow, User
+
+
+def increment(model, pk, field, step=1):
+    """Atomically changes a denormalized counter, never below zero."""
+    model.objects.filter(pk=pk).update(
+        **{field: Greatest(F(field) + step, Value(0))}
+    )
+
+
+def _count(model, field):
+    """Subquery counting the rows of `model` that point to the outer
+    object through `field`.
+    """
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(total=Count("pk"))
+            .values("total")
+        ),
+        0,
+    )
+
+
+def recount():
+    """Recomputes all counters from the source tables."""
+    Recipe.objects.update(
+        favorites_count=_count(FavoriteRecipe, "recipe"),
+        cart_count=_count(CartRecipe, "recipe"),
+        ingredients_count=_count(RecipeIngredient, "recipe"),
+    )
+    User.objects.update(
+        recipes_count=_count(Recipe, "author"),
+        followers_count=_count(Follow, "author"),
+    )
@@ -0,0 +1,165 @@
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import OuterRef, Q, Subquery
+
+from recipes.models import FeedEntry, Recipe
+from users.models import Follow, User
+
+# Feeds trimmed by one DELETE statement
+TRIM_BATCH_SIZE = 500
+
+
+def is_pulled(author):
+    """Recipes of authors with too many followers are not written to
+    every feed, they are merged in when the feed is read. The choice is
+    recorded per recipe in `fanned_out`, so authors crossing the limit
+    either way lose nothing from the feeds.
+    """
+    return author.followers_count > settings.FEED_FANOUT_MAX_FOLLOWERS
+
+
+def trim(user_ids):
+    """Keeps only the FEED_MAX_ENTRIES newest entries of every user.
+
+    The first entry past the cap is looked up per user on the
+    (user, -pub_date, -recipe) index. Feeds within the cap cost that lookup
+    only, in the others just the entries from the cutoff on are deleted.
+    """
+    if not user_ids:
+        return
+    past_cap = (
+        FeedEntry.objects.filter(user_id=OuterRef("pk"))
+        .order_by("-pub_date", "-recipe_id")
+        .values("id")
+    )[settings.FEED_MAX_ENTRIES:settings.FEED_MAX_ENTRIES + 1]
+    cutoffs = list(
+        User.objects.filter(pk__in=user_ids)
+        .annotate(cutoff_id=Subquery(past_cap))
+        .filter(cutoff_id__isnull=False)
+        .values_list("cutoff_id", flat=True)
+    )
+    table = FeedEntry._meta.db_table
+    for start in range(0, len(cutoffs), TRIM_BATCH_SIZE):
+        batch = cutoffs[start:start + TRIM_BATCH_SIZE]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {table} WHERE id IN ("
+                f"SELECT entry.id FROM {table} entry "
+                f"INNER JOIN {table} cutoff "
+                "ON entry.user_id = cutoff.user_id "
+                f"WHERE cutoff.id IN ({', '.join(['%s'] * len(batch))}) "
+                "AND (entry.pub_date < cutoff.pub_date "
+                "OR (entry.pub_date = cutoff.pub_date "
+                "AND entry.recipe_id <= cutoff.recipe_id)))",
+                batch,
+            )
+
+
+def fan_out(recipe):
+    """Writes a new recipe to the feeds of the author's followers."""
+    if is_pulled(recipe.author):
+        return
+    Recipe.objects.filter(pk=recipe.pk).update(fanned_out=True)
+    recipe.fanned_out = True
+    followers = Follow.objects.filter(author_id=recipe.author_id).values_list(
+        "user_id", flat=True
+    )
+    user_ids = list(followers)
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user_id=user_id, recipe=recipe, pub_date=recipe.pub_date)
+            for user_id in user_ids
+        ),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    trim(user_ids)
+
+
+def backfill(user_id, author):
+    """Adds the latest fanned out recipes of a newly followed author to
+    the feed, the others are merged in on read.
+    """
+    recipes = Recipe.objects.filter(author=author, fanned_out=True).order_by(
+        "-pub_date", "-id"
+    )[: settings.FEED_MAX_ENTRIES]
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(user_id=user_id, recipe_id=pk, pub_date=pub_date)
+            for pk, pub_date in recipes.values_list("id", "pub_date")
+        ),
+        ignore_conflicts=True,
+    )
+    trim([user_id])
+
+
+def remove(user_id, author_id):
+    """Drops the recipes of an unfollowed author from the feed."""
+    FeedEntry.objects.filter(
+        user_id=user_id, recipe__author_id=author_id
+    ).delete()
+
+
+class Feed:
+    """The user's feed, newest first: their entries read along the
+    (user, -pub_date, -recipe) index merged with the followed authors'
+    recipes that were not fanned out, read along their partial index.
+
+    Both sides are read as (pub_date, id) keys with the same limit and
+    merged in memory, then only the recipes of the requested slice are
+    loaded. Supports count() and slicing, so it paginates like a
+    queryset; count() and page numbers stop at FEED_MAX_ENTRIES.
+    """
+
+    model = Recipe
+    ordered = True
+
+    def __init__(self, user, position=None):
+        self.user = user
+        self.position = position
+
+    def after(self, pub_date, pk):
+        """The part of the feed older than the (pub_date, id) key."""
+        return Feed(self.user, (pub_date, pk))
+
+    def _keys(self, limit):
+        entries = FeedEntry.objects.filter(user=self.user).order_by(
+            "-pub_date", "-recipe_id"
+        )
+        pulled = Recipe.objects.filter(
+            author_id__in=Follow.objects.filter(user=self.user).values(
+                "author_id"
+            ),
+            fanned_out=False,
+        ).order_by("-pub_date", "-id")
+        if self.position is not None:
+            pub_date, pk = self.position
+            entries = entries.filter(
+                Q(pub_date__lt=pub_date)
+                | Q(pub_date=pub_date, recipe_id__lt=pk)
+            )
+            pulled = pulled.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk)
+            )
+        merged = heapq.merge(
+            entries.values_list("pub_date", "recipe_id")[:limit],
+            pulled.values_list("pub_date", "id")[:limit],
+            reverse=True,
+        )
+        return list(islice(merged, limit))
+
+    def count(self):
+        return len(self._keys(settings.FEED_MAX_ENTRIES))
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step:
+            raise TypeError("Feed supports plain slices only")
+        stop = index.stop
+        if stop is None or stop > settings.FEED_MAX_ENTRIES:
+            stop = settings.FEED_MAX_ENTRIES
+        ids = [pk for _, pk in self._keys(stop)[index.start:stop]]
+        recipes = Recipe.objects.filter(pk__in=ids).for_listing().in_bulk()
+        return [recipes[pk] for pk in ids if pk in recipes]
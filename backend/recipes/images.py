@@ -0,0 +1,234 @@
+import base64
+import binascii
+import io
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.uploadedfile import (InMemoryUploadedFile,
+                                            TemporaryUploadedFile)
+from django.template.defaultfilters import filesizeformat
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from recipes.cache import bump_version_on_commit
+
+ALLOWED_FORMATS = ("JPEG", "PNG", "WEBP", "GIF")
+# Largest first: every variant is resized from the previous one.
+VARIANTS = {
+    "full": (1280, 1280),
+    "card": (480, 480),
+    "thumbnail": (160, 160),
+}
+ENCODERS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+# Re-encoding options for originals stripped of their metadata.
+ORIGINAL_ENCODERS = {
+    "JPEG": {"quality": 95},
+    "WEBP": {"quality": 95},
+}
+# Multiple of 4, so every chunk decodes on its own.
+DECODE_CHUNK_SIZE = 64 * 1024
+
+
+class ImageError(ValueError):
+    """The upload is not an image the pipeline accepts."""
+
+
+def check_size(size):
+    if size > settings.RECIPE_IMAGE_MAX_SIZE:
+        raise ImageError(
+            "Image should be smaller than "
+            f"{filesizeformat(settings.RECIPE_IMAGE_MAX_SIZE)}"
+        )
+
+
+def decode_data_uri(data):
+    """Decodes a data:image/...;base64, URI chunk by chunk.
+
+    The size is checked from the length of the payload before anything
+    is decoded and again while decoding. Like Django's upload handlers,
+    small images are kept in memory, larger ones are written to a
+    temporary file. Neither the payload nor the decoded image is copied
+    as a whole.
+    """
+    offset = data.find(";base64,")
+    if offset < 0:
+        raise ImageError("Upload a valid image")
+    content_type = data[len("data:"):offset]
+    offset += len(";base64,")
+    check_size((len(data) - offset) * 3 // 4)
+    name = "temp." + content_type.split("/")[-1]
+    if len(data) - offset > settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+        file = TemporaryUploadedFile(name, content_type, 0, None)
+    else:
+        file = InMemoryUploadedFile(
+            io.BytesIO(), None, name, content_type, 0, None
+        )
+    size = 0
+    remainder = ""
+    try:
+        for start in range(offset, len(data), DECODE_CHUNK_SIZE):
+            chunk = remainder + "".join(
+                data[start:start + DECODE_CHUNK_SIZE].split()
+            )
+            usable = len(chunk) - len(chunk) % 4
+            remainder = chunk[usable:]
+            decoded = base64.b64decode(chunk[:usable], validate=True)
+            size += len(decoded)
+            check_size(size)
+            file.write(decoded)
+        if remainder:
+            raise ImageError("Upload a valid image")
+    except binascii.Error:
+        file.close()
+        raise ImageError("Upload a valid image")
+    except ImageError:
+        file.close()
+        raise
+    file.size = size
+    file.seek(0)
+    return file
+
+
+def check_header(file):
+    """Reads format and dimensions from the image header only, the
+    pixels are not decoded.
+    """
+    position = file.tell()
+    try:
+        with Image.open(file) as image:
+            image_format, (width, height) = image.format, image.size
+    except (OSError, Image.DecompressionBombError):
+        raise ImageError("Upload a valid image")
+    finally:
+        file.seek(position)
+    if image_format not in ALLOWED_FORMATS:
+        raise ImageError(f"{image_format} images are not supported")
+    limit = settings.RECIPE_IMAGE_MAX_DIMENSION
+    if width > limit or height > limit:
+        raise ImageError(f"Image should be at most {limit}x{limit} pixels")
+
+
+def _flatten(image):
+    """Drops transparency onto a white background, JPEG has no alpha."""
+    if image.mode in ("RGB", "L"):
+        return image
+    image = image.convert("RGBA")
+    background = Image.new("RGB", image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel("A"))
+    return background
+
+
+def _encode(image, encoder):
+    image_format, options = ENCODERS[encoder]
+    buffer = io.BytesIO()
+    # No exif or icc arguments: the variants carry no metadata.
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def _has_metadata(image):
+    return bool(image.getexif()) and getattr(image, "n_frames", 1) == 1
+
+
+def _strip_original(image, name, storage):
+    """Stores the original again without its EXIF data, such as the
+    camera and the GPS position, with its orientation applied. Returns
+    the decoded image and the name of the new original.
+    """
+    image_format = image.format
+    icc_profile = image.info.get("icc_profile")
+    image = ImageOps.exif_transpose(image)
+    # Like uploads, large originals are encoded to disk.
+    with tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+    ) as buffer:
+        image.save(
+            buffer,
+            image_format,
+            icc_profile=icc_profile,
+            **ORIGINAL_ENCODERS.get(image_format, {}),
+        )
+        buffer.seek(0)
+        name = storage.save(name, File(buffer, name))
+    return image, name
+
+
+def build_variants(recipe):
+    """Writes resized WebP and JPEG copies of the recipe image and
+    stores their names in `image_variants`:
+    {"card": {"webp": name, "jpeg": name}, ...}.
+
+    Originals carrying EXIF data are replaced by a stripped copy, the
+    upload itself is stored as it was received.
+    """
+    storage = recipe._meta.get_field("image").storage
+    variants = {}
+    fields = {}
+    if recipe.image:
+        stem = os.path.splitext(os.path.basename(recipe.image.name))[0]
+        with recipe.image.open("rb") as file, Image.open(file) as image:
+            if _has_metadata(image):
+                image, fields["image"] = _strip_original(
+                    image, recipe.image.name, storage
+                )
+            else:
+                # JPEGs are decoded at the smallest scale still covering
+                # the largest variant.
+                image.draft("RGB", max(VARIANTS.values()))
+            image = _flatten(ImageOps.exif_transpose(image))
+            for variant, size in VARIANTS.items():
+                # In place, without a copy of the full-size image.
+                image.thumbnail(size, Image.LANCZOS)
+                variants[variant] = {
+                    encoder: storage.save(
+                        f"recipes/images/{variant}/{stem}.{encoder}",
+                        ContentFile(_encode(image, encoder)),
+                    )
+                    for encoder in ENCODERS
+                }
+    # A newer upload replaced the image meanwhile, its own job will
+    # build the variants. Files are shared between recipes with the same
+    # image, unused ones (such as replaced originals) are removed by
+    # gc_recipe_images.
+    updated = update_recipes(
+        type(recipe).objects.filter(
+            pk=recipe.pk, image=recipe.image.name or None
+        ),
+        image_variants=variants,
+        image_status=recipe.ImageStatus.DONE,
+        **fields,
+    )
+    if updated:
+        recipe.image_variants = variants
+        recipe.image_status = recipe.ImageStatus.DONE
+        if "image" in fields:
+            recipe.image = fields["image"]
+
+
+def schedule_variants(recipe):
+    """Builds the variants right away or, with RECIPE_IMAGES_ASYNC,
+    leaves them to the process_recipe_images worker.
+    """
+    if not settings.RECIPE_IMAGES_ASYNC:
+        build_variants(recipe)
+        return
+    recipe.image_status = recipe.ImageStatus.PENDING
+    update_recipes(
+        type(recipe).objects.filter(pk=recipe.pk),
+        image_status=recipe.image_status,
+    )
+
+
+def update_recipes(queryset, **fields):
+    """Queryset update of recipe fields shown by the API, which bypasses
+    save(): updated_at and the cached versions are kept in step here.
+    """
+    updated = queryset.update(updated_at=timezone.now(), **fields)
+    if updated:
+        bump_version_on_commit(queryset.model)
+    return updated
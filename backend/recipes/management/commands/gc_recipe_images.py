@@ -0,0 +1,64 @@
+import os
+import time
+
+from django.core.management import BaseCommand
+
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Deletes recipe image files no recipe refers to"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace",
+            type=int,
+            default=60 * 60,
+            help=(
+                "Keep files younger than this many seconds, they may "
+                "belong to uploads still in progress"
+            ),
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only list the files that would be deleted",
+        )
+
+    def handle(self, *args, **options):
+        field = Recipe._meta.get_field("image")
+        storage = field.storage
+        referenced = set()
+        recipes = Recipe.objects.values_list("image", "image_variants")
+        for image, variants in recipes.iterator():
+            referenced.add(image)
+            for names in variants.values():
+                referenced.update(names.values())
+
+        cutoff = time.time() - options.get("grace")
+        deleted = freed = 0
+        for name in self._walk(storage, field.upload_to.rstrip("/")):
+            if name in referenced:
+                continue
+            if storage.get_modified_time(name).timestamp() > cutoff:
+                continue
+            size = storage.size(name)
+            if options.get("verbosity") > 1 or options.get("dry_run"):
+                self.stdout.write(name)
+            if not options.get("dry_run"):
+                storage.delete(name)
+            deleted += 1
+            freed += size
+        action = "Would delete" if options.get("dry_run") else "Deleted"
+        self.stdout.write(
+            f"{action} {deleted} unreferenced files, {freed} bytes"
+        )
+
+    def _walk(self, storage, path):
+        if not storage.exists(path):
+            return
+        directories, files = storage.listdir(path)
+        for name in files:
+            yield os.path.join(path, name)
+        for directory in directories:
+            yield from self._walk(storage, os.path.join(path, directory))
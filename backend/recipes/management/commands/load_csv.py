@@ -1,7 +1,12 @@
+import time
 from csv import DictReader
+from itertools import islice
 
 from django.apps import apps
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
+from django.db import models, transaction
+
+from recipes.cache import bump_version
 
 
 class Command(BaseCommand):
@@ -22,15 +27,104 @@ class Command(BaseCommand):
             help="Name of the model to data insert",
             default="Ingredient",
         )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of rows inserted per query and per transaction",
+        )
+        parser.add_argument(
+            "--on-conflict",
+            choices=("ignore", "update"),
+            default="ignore",
+            help="What to do with rows that already exist in the DB",
+        )
+        parser.add_argument(
+            "--fieldnames",
+            type=str,
+            help=(
+                "Comma separated column names for files without "
+                "a header row, e.g. name,measurement_unit"
+            ),
+        )
 
     def handle(self, *args, **options):
         path = options.get("path")
         model = apps.get_model("recipes", options.get("model"))
+        batch_size = options.get("batch_size")
+        if batch_size < 1:
+            raise CommandError("Batch size should be 1 or more")
+        fieldnames = options.get("fieldnames")
+        if fieldnames:
+            fieldnames = fieldnames.split(",")
+        update = options.get("on_conflict") == "update"
+        key_fields = self._get_key_fields(model) if update else None
+
+        total_before = model.objects.count()
+        processed = 0
+        started = time.monotonic()
+        with open(path, "r", encoding="utf-8", newline="") as file:
+            rows = DictReader(file, fieldnames=fieldnames)
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                processed += len(batch)
+                with transaction.atomic():
+                    if update:
+                        self._update_existing(model, key_fields, batch)
+                    model.objects.bulk_create(
+                        (model(**row) for row in batch),
+                        batch_size=batch_size,
+                        ignore_conflicts=True,
+                    )
+                if options.get("verbosity") > 1:
+                    self.stdout.write(f"Processed {processed} rows")
 
-        with open(path, "r", encoding="utf-8") as file:
-            for row in DictReader(file):
-                record = model(**row)
-                record.save()
-                self.stdout.write(f"Added to a database: {row}")
+        bump_version(model)
+        elapsed = time.monotonic() - started
+        added = model.objects.count() - total_before
+        self.stdout.write(
+            f"Import to a database finished: {processed} rows processed, "
+            f"{added} added, {processed - added} skipped or updated "
+            f"in {elapsed:.2f}s ({processed / max(elapsed, 1e-6):.0f} rows/s)"
+        )
+
+    def _get_key_fields(self, model):
+        """Fields of the first unique constraint, used to match CSV rows
+        with the records already stored.
+        """
+        for constraint in model._meta.constraints:
+            if isinstance(constraint, models.UniqueConstraint):
+                return list(constraint.fields)
+        raise CommandError(
+            f"{model.__name__} has no unique constraint to update on"
+        )
 
-            self.stdout.write("Import to a database finished")
+    def _update_existing(self, model, key_fields, batch):
+        """Updates stored records that match rows of the batch and removes
+        those rows from the batch.
+        """
+        first_key = key_fields[0]
+        existing = {
+            tuple(str(getattr(obj, field)) for field in key_fields): obj
+            for obj in model.objects.filter(
+                **{f"{first_key}__in": {row[first_key] for row in batch}}
+            )
+        }
+        to_update = []
+        to_create = []
+        for row in batch:
+            obj = existing.get(tuple(row[field] for field in key_fields))
+            if obj is None:
+                to_create.append(row)
+                continue
+            for field, value in row.items():
+                setattr(obj, field, value)
+            to_update.append(obj)
+        update_fields = [
+            field for field in batch[0] if field not in key_fields
+        ]
+        if to_update and update_fields:
+            model.objects.bulk_update(to_update, update_fields)
+        batch[:] = to_create
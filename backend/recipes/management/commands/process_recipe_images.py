@@ -0,0 +1,78 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from recipes.images import build_variants, update_recipes
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Generates resized variants of queued recipe images"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit when the queue is empty instead of waiting",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait before polling an empty queue again",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            recipe = self._claim_job()
+            if recipe is None:
+                if options.get("once"):
+                    break
+                time.sleep(options.get("interval"))
+                continue
+            self._process(recipe)
+
+    def _claim_job(self):
+        # Recipes still processing after RECIPE_IMAGE_JOB_TIMEOUT were
+        # claimed by a worker that died, they are taken over.
+        stale_before = timezone.now() - timedelta(
+            seconds=settings.RECIPE_IMAGE_JOB_TIMEOUT
+        )
+        with transaction.atomic():
+            recipe = (
+                Recipe.objects.select_for_update(skip_locked=True)
+                .filter(
+                    Q(image_status=Recipe.ImageStatus.PENDING)
+                    | Q(
+                        image_status=Recipe.ImageStatus.PROCESSING,
+                        updated_at__lt=stale_before,
+                    )
+                )
+                .order_by("pk")
+                .first()
+            )
+            if recipe is not None:
+                update_recipes(
+                    Recipe.objects.filter(pk=recipe.pk),
+                    image_status=Recipe.ImageStatus.PROCESSING,
+                )
+        return recipe
+
+    def _process(self, recipe):
+        try:
+            build_variants(recipe)
+        except Exception as error:
+            update_recipes(
+                Recipe.objects.filter(
+                    pk=recipe.pk, image_status=Recipe.ImageStatus.PROCESSING
+                ),
+                image_status=Recipe.ImageStatus.FAILED,
+            )
+            self.stderr.write(f"Failed to process recipe {recipe.pk}: {error}")
+            return
+        self.stdout.write(f"Processed recipe {recipe.pk}")
@@ -0,0 +1,29 @@
+from django.core.management import BaseCommand
+
+from recipes.models import CartRecipe, ShoppingListItem
+from recipes.shopping_list import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recomputes shopping lists from the shopping carts"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "user_ids",
+            nargs="*",
+            type=int,
+            help="Users to rebuild the lists of, all users by default",
+        )
+
+    def handle(self, *args, **options):
+        user_ids = set(options.get("user_ids"))
+        if not user_ids:
+            user_ids.update(
+                CartRecipe.objects.values_list("user_id", flat=True)
+            )
+            user_ids.update(
+                ShoppingListItem.objects.values_list("user_id", flat=True)
+            )
+        for user_id in sorted(user_ids):
+            rebuild(user_id)
+        self.stdout.write(f"Shopping lists rebuilt for {len(user_ids)} users")
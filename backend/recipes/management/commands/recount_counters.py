@@ -0,0 +1,13 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+
+from recipes.counters import recount
+
+
+class Command(BaseCommand):
+    help = "Recomputes favorites, carts, recipes and followers counters"
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            recount()
+        self.stdout.write("Counters recomputed")
@@ -0,0 +1,33 @@
+from django.db import migrations
+
+INDEX_NAME = "recipes_ingredient_name_upper_prefix_idx"
+
+
+def create_prefix_index(apps, schema_editor):
+    """Index for `name__istartswith` lookups, which PostgreSQL runs as
+    UPPER(name) LIKE 'PREFIX%'. The pattern operator class lets the
+    planner use the index whatever the database collation is.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} "
+        "ON recipes_ingredient (UPPER(name) text_pattern_ops)"
+    )
+
+
+def drop_prefix_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_auto_20230829_1425'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_prefix_index, drop_prefix_index),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 3.2 on 2026-10-18 03:09
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_lists(apps, schema_editor):
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    rows = (
+        RecipeIngredient.objects
+        .values('recipe__ShoppingCart__user', 'ingredient')
+        .filter(recipe__ShoppingCart__user__isnull=False)
+        .annotate(total=models.Sum('amount'))
+        .order_by()
+    )
+    ShoppingListItem.objects.bulk_create(
+        (
+            ShoppingListItem(
+                user_id=row['recipe__ShoppingCart__user'],
+                ingredient_id=row['ingredient'],
+                amount=row['total'],
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0007_ingredient_name_prefix_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(verbose_name='Total amount')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ShoppingList', to='recipes.ingredient', verbose_name='Ingredient')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ShoppingList', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Shopping list item',
+                'verbose_name_plural': 'Shopping list items',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='ingredient_already_in_the_shopping_list'),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 3.2 on 2026-10-18 03:13
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def _count(model, field):
+    return Coalesce(
+        models.Subquery(
+            model.objects.filter(**{field: models.OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=models.Count('pk'))
+            .values('total')
+        ),
+        0,
+    )
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FavoriteRecipe = apps.get_model('recipes', 'FavoriteRecipe')
+    CartRecipe = apps.get_model('recipes', 'CartRecipe')
+    User = apps.get_model('users', 'User')
+    Follow = apps.get_model('users', 'Follow')
+    Recipe.objects.update(
+        favorites_count=_count(FavoriteRecipe, 'recipe'),
+        cart_count=_count(CartRecipe, 'recipe'),
+    )
+    User.objects.update(
+        recipes_count=_count(Recipe, 'author'),
+        followers_count=_count(Follow, 'author'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_pub_date_id_idx'),
+        ('users', '0003_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Shopping carts count'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Favorites count'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-pub_date'], name='recipe_favorites_count_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
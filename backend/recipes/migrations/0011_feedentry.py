@@ -0,0 +1,54 @@
+# Generated by Django 3.2 on 2026-10-18 03:15
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+FEED_MAX_ENTRIES = 500
+
+
+def fill_feeds(apps, schema_editor):
+    Follow = apps.get_model('users', 'Follow')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FeedEntry = apps.get_model('recipes', 'FeedEntry')
+    for user_id, author_id in Follow.objects.values_list('user', 'author'):
+        recipes = Recipe.objects.filter(author_id=author_id).order_by(
+            '-pub_date', '-id'
+        )[:FEED_MAX_ENTRIES]
+        FeedEntry.objects.bulk_create(
+            FeedEntry(user_id=user_id, recipe_id=pk, pub_date=pub_date)
+            for pk, pub_date in recipes.values_list('id', 'pub_date')
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0010_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Recipe date created')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='FeedEntries', to='recipes.recipe', verbose_name='Recipe')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='Feed', to=settings.AUTH_USER_MODEL, verbose_name='User')),
+            ],
+            options={
+                'verbose_name': 'Feed entry',
+                'verbose_name_plural': 'Feed entries',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', '-pub_date'], name='feedentry_user_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='recipe_already_in_the_feed'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """Covering index for tag filters, which look the recipe-tag table up
+    by tag first. The table is created by the ManyToManyField, so the
+    index can not be declared on a model.
+    """
+
+    dependencies = [
+        ('recipes', '0011_feedentry'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX recipes_recipe_tags_tag_recipe_idx '
+            'ON recipes_recipe_tags (tag_id, recipe_id)',
+            'DROP INDEX recipes_recipe_tags_tag_recipe_idx',
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.2 on 2026-10-18 03:16
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+INDEX_NAME = "recipes_recipe_search_vector_idx"
+
+
+def create_search_index(apps, schema_editor):
+    """GIN index over the stored vector and a backfill of the existing
+    recipes. Other databases search with a plain substring match.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(
+        "UPDATE recipes_recipe SET search_vector = "
+        "setweight(to_tsvector('russian', COALESCE(name, '')), 'A') || "
+        "setweight(to_tsvector('russian', COALESCE(text, '')), 'B')"
+    )
+    schema_editor.execute(
+        f"CREATE INDEX IF NOT EXISTS {INDEX_NAME} "
+        "ON recipes_recipe USING gin (search_vector)"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(f"DROP INDEX IF EXISTS {INDEX_NAME}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_recipe_tags_tag_recipe_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
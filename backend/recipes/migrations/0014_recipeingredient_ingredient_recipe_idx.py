@@ -0,0 +1,17 @@
+# Generated by Django 3.2 on 2026-10-18 03:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipeingredient',
+            index=models.Index(fields=['ingredient', 'recipe'], name='recipeingredient_ingr_idx'),
+        ),
+    ]
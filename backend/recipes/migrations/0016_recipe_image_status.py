@@ -0,0 +1,29 @@
+# Generated by Django 3.2 on 2026-10-18 03:20
+
+from django.db import migrations, models
+
+
+def queue_existing_images(apps, schema_editor):
+    """Recipes uploaded before the variants existed are left to the
+    process_recipe_images worker.
+    """
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.exclude(image__isnull=True).exclude(image='').filter(
+        image_variants={}
+    ).update(image_status='pending')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0015_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], db_index=True, default='done', editable=False, max_length=10, verbose_name='Image status'),
+        ),
+        migrations.RunPython(queue_existing_images, migrations.RunPython.noop),
+    ]
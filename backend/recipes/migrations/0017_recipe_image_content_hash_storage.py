@@ -0,0 +1,19 @@
+# Generated by Django 3.2 on 2026-10-18 03:22
+
+from django.db import migrations, models
+import recipes.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0016_recipe_image_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='image',
+            field=models.ImageField(default=None, null=True, storage=recipes.storage.recipe_image_storage, upload_to='recipes/images/'),
+        ),
+    ]
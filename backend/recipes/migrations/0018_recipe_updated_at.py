@@ -0,0 +1,26 @@
+# Generated by Django 3.2 on 2026-10-18 03:25
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def copy_pub_date(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Recipe.objects.update(updated_at=models.F('pub_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0017_recipe_image_content_hash_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Date updated'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_pub_date, migrations.RunPython.noop),
+    ]
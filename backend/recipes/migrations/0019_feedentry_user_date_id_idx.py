@@ -0,0 +1,21 @@
+# Generated by Django 3.2 on 2026-10-18 04:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0018_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='feedentry',
+            name='feedentry_user_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['user', '-pub_date', '-id'], name='feedentry_user_date_id_idx'),
+        ),
+    ]
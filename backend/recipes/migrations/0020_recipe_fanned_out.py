@@ -0,0 +1,34 @@
+# Generated by Django 3.2 on 2026-10-18 04:18
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_fanned_out(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FeedEntry = apps.get_model('recipes', 'FeedEntry')
+    Recipe.objects.filter(
+        author__followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).update(fanned_out=True)
+    # The other recipes are merged into the feeds on read.
+    FeedEntry.objects.filter(recipe__fanned_out=False).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0019_feedentry_user_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='fanned_out',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Written to the feeds'),
+        ),
+        migrations.RunPython(mark_fanned_out, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(fanned_out=False), fields=['author', '-pub_date', '-id'], name='recipe_pulled_author_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.2 on 2026-10-18 04:21
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_ingredients_count(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    Recipe.objects.update(
+        ingredients_count=Coalesce(
+            models.Subquery(
+                RecipeIngredient.objects.filter(recipe=models.OuterRef('pk'))
+                .order_by()
+                .values('recipe')
+                .annotate(total=models.Count('pk'))
+                .values('total')
+            ),
+            0,
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0021_feedentry_user_date_recipe_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='ingredients_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Ingredients count'),
+        ),
+        migrations.RunPython(
+            fill_ingredients_count, migrations.RunPython.noop
+        ),
+    ]
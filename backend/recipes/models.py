@@ -1,8 +1,14 @@
 from colorfield.fields import ColorField
 from django.conf import settings
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector, SearchVectorField)
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models
+from django.db.models import (Case, Count, F, OuterRef, Prefetch, Q,
+                              Subquery, Value, When, Window)
+from django.db.models.functions import Lower, RowNumber
 
+from recipes.storage import recipe_image_storage
 from users.models import User
 
 
@@ -49,9 +55,155 @@ class Ingredient(models.Model):
         return f"{self.name} ({self.measurement_unit})"
 
 
+SEARCH_CONFIG = "russian"
+
+
+def recipe_search_vector():
+    return SearchVector(
+        "name", weight="A", config=SEARCH_CONFIG
+    ) + SearchVector("text", weight="B", config=SEARCH_CONFIG)
+
+
+class Casefold(Lower):
+    """LOWER() that also folds Cyrillic on SQLite, whose LOWER() and
+    LIKE only know ASCII. CASEFOLD is registered on every SQLite
+    connection in recipes.signals.
+    """
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection, function="CASEFOLD", **extra_context
+        )
+
+
+class RecipeQuerySet(models.QuerySet):
+    """Recipe queryset with helpers for the API listings."""
+
+    def for_listing(self):
+        """Fetches everything RecipeSerializer needs in a fixed number of
+        queries, whatever the size of the page.
+        """
+        return self.select_related("author").prefetch_related(
+            "tags",
+            Prefetch(
+                "Amounts",
+                queryset=RecipeIngredient.objects.select_related(
+                    "ingredient"
+                ),
+                to_attr="ingredient_amounts",
+            ),
+        )
+
+    def search(self, query):
+        """Full-text search over name and text ranked by relevance.
+
+        PostgreSQL uses the stored, GIN-indexed search_vector with
+        Russian stemming. Other databases fall back to a case folded
+        substring match ranking name matches first.
+        """
+        if connections[self.db].vendor == "postgresql":
+            search_query = SearchQuery(
+                query, config=SEARCH_CONFIG, search_type="websearch"
+            )
+            return (
+                self.filter(search_vector=search_query)
+                .annotate(rank=SearchRank(F("search_vector"), search_query))
+                .order_by("-rank", "-pub_date")
+            )
+        query = query.casefold()
+        return (
+            self.alias(name_folded=Casefold("name"),
+                       text_folded=Casefold("text"))
+            .filter(
+                Q(name_folded__contains=query)
+                | Q(text_folded__contains=query)
+            )
+            .annotate(
+                rank=Case(
+                    When(name_folded__contains=query, then=Value(1.0)),
+                    default=Value(0.5),
+                    output_field=models.FloatField(),
+                )
+            )
+            .order_by("-rank", "-pub_date")
+        )
+
+    def by_ingredients(self, ingredient_ids):
+        """Recipes using any of the ingredients, annotated with how many
+        of their ingredients are `matched` and how many are `missing`.
+        Recipes closest to complete come first.
+
+        Only the newest RECIPES_BY_INGREDIENTS_CANDIDATES recipes using
+        any of the ingredients are ranked; they are read from the
+        (ingredient, recipe) index. `matched` is counted on the (recipe,
+        ingredient) index and `missing` comes from the stored
+        ingredients_count, no other ingredient rows are read.
+        """
+        candidates = (
+            RecipeIngredient.objects.filter(ingredient_id__in=ingredient_ids)
+            .order_by("-recipe_id")
+            .values("recipe_id")
+            .distinct()[:settings.RECIPES_BY_INGREDIENTS_CANDIDATES]
+        )
+        matched = (
+            RecipeIngredient.objects.filter(
+                recipe_id=OuterRef("pk"), ingredient_id__in=ingredient_ids
+            )
+            .order_by()
+            .values("recipe_id")
+            .annotate(total=Count("ingredient_id"))
+            .values("total")
+        )
+        return (
+            self.filter(pk__in=candidates)
+            .annotate(matched=Subquery(matched))
+            .annotate(missing=F("ingredients_count") - F("matched"))
+            .order_by("missing", "-matched", "-pub_date", "-id")
+        )
+
+    def latest_by_author(self, author_ids, limit=None):
+        """Returns {author_id: [recipes]} with the `limit` latest recipes
+        of every author, fetched with one ROW_NUMBER() window query.
+        """
+        recipes_by_author = {author_id: [] for author_id in author_ids}
+        if not author_ids:
+            return recipes_by_author
+        ranked = (
+            self.filter(author_id__in=author_ids)
+            .annotate(
+                row_number=Window(
+                    RowNumber(),
+                    partition_by=F("author_id"),
+                    order_by=(F("pub_date").desc(), F("id").desc()),
+                )
+            )
+            .order_by()
+        )
+        sql, params = ranked.query.sql_with_params()
+        if limit is None:
+            recipes = self.raw(
+                f"SELECT * FROM ({sql}) ranked ORDER BY row_number", params
+            )
+        else:
+            recipes = self.raw(
+                f"SELECT * FROM ({sql}) ranked WHERE row_number <= %s "
+                "ORDER BY row_number",
+                (*params, limit),
+            )
+        for recipe in recipes:
+            recipes_by_author[recipe.author_id].append(recipe)
+        return recipes_by_author
+
+
 class Recipe(models.Model):
     """Recipe db model class."""
 
+    class ImageStatus(models.TextChoices):
+        PENDING = "pending", "Pending"
+        PROCESSING = "processing", "Processing"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -69,7 +221,10 @@ class Recipe(models.Model):
                 1, message='Time of cooking should be 1 or more'),),
     )
     image = models.ImageField(
-        upload_to="recipes/images/", null=True, default=None
+        upload_to="recipes/images/",
+        storage=recipe_image_storage,
+        null=True,
+        default=None,
     )
     tags = models.ManyToManyField(
         Tag, verbose_name="Tag", related_query_name="Recipes"
@@ -80,11 +235,56 @@ class Recipe(models.Model):
     pub_date = models.DateTimeField(
         auto_now_add=True, verbose_name="Date created"
     )
+    updated_at = models.DateTimeField(
+        auto_now=True, verbose_name="Date updated"
+    )
+    image_variants = models.JSONField(
+        "Image variants", default=dict, blank=True, editable=False
+    )
+    image_status = models.CharField(
+        "Image status",
+        max_length=10,
+        choices=ImageStatus.choices,
+        default=ImageStatus.DONE,
+        editable=False,
+        db_index=True,
+    )
+    search_vector = SearchVectorField(null=True, editable=False)
+    favorites_count = models.PositiveIntegerField(
+        "Favorites count", default=0, editable=False
+    )
+    cart_count = models.PositiveIntegerField(
+        "Shopping carts count", default=0, editable=False
+    )
+    ingredients_count = models.PositiveSmallIntegerField(
+        "Ingredients count", default=0, editable=False
+    )
+    # Written to the followers' feeds when created, otherwise merged
+    # into them when they are read; see recipes.feed.
+    fanned_out = models.BooleanField(
+        "Written to the feeds", default=False, editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ["-pub_date"]
         verbose_name = "Recipe"
         verbose_name_plural = "Recipes"
+        indexes = [
+            models.Index(
+                fields=["-pub_date", "-id"], name="recipe_pub_date_id_idx"
+            ),
+            models.Index(
+                fields=["-favorites_count", "-pub_date"],
+                name="recipe_favorites_count_idx",
+            ),
+            models.Index(
+                fields=["author", "-pub_date", "-id"],
+                condition=models.Q(fanned_out=False),
+                name="recipe_pulled_author_idx",
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -121,6 +321,12 @@ class RecipeIngredient(models.Model):
                 name="this_ingredient_already_already_in_the_recipe",
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=["ingredient", "recipe"],
+                name="recipeingredient_ingr_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.amount} of {self.ingredient} in {self.recipe}"
@@ -184,3 +390,75 @@ class CartRecipe(models.Model):
 
     def __str__(self):
         return f"{self.user} like {self.recipe.name}"
+
+
+class ShoppingListItem(models.Model):
+    """Total amount of an ingredient over all recipes in the user's
+    shopping cart, maintained by recipes.shopping_list.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="ShoppingList",
+        verbose_name="User",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name="ShoppingList",
+        verbose_name="Ingredient",
+    )
+    amount = models.PositiveIntegerField("Total amount")
+
+    class Meta:
+        verbose_name = "Shopping list item"
+        verbose_name_plural = "Shopping list items"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "ingredient"],
+                name="ingredient_already_in_the_shopping_list",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.amount} of {self.ingredient} for {self.user}"
+
+
+class FeedEntry(models.Model):
+    """Recipe of a followed author in the user's home feed, written by
+    recipes.feed when the recipe is created or the author is followed.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="Feed",
+        verbose_name="User",
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="FeedEntries",
+        verbose_name="Recipe",
+    )
+    pub_date = models.DateTimeField("Recipe date created")
+
+    class Meta:
+        verbose_name = "Feed entry"
+        verbose_name_plural = "Feed entries"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "recipe"],
+                name="recipe_already_in_the_feed",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-pub_date", "-recipe"],
+                name="feedentry_user_date_recipe_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.recipe} in the feed of {self.user}"
@@ -0,0 +1,106 @@
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.models import CartRecipe, RecipeIngredient, ShoppingListItem
+
+
+# Shopping lists updated together by change_recipe
+CHANGE_BATCH_SIZE = 500
+
+
+def _apply(user_ids, amounts):
+    """Adds signed ingredient amounts to the shopping lists of the users
+    and drops the items that reach zero, with one query of each kind.
+    """
+    items = ShoppingListItem.objects.select_for_update().filter(
+        user_id__in=user_ids, ingredient_id__in=amounts
+    )
+    existing = {(item.user_id, item.ingredient_id): item for item in items}
+    changed, emptied, created = [], [], []
+    for user_id in user_ids:
+        for ingredient_id, amount in amounts.items():
+            item = existing.get((user_id, ingredient_id))
+            if item is None:
+                if amount > 0:
+                    created.append(
+                        ShoppingListItem(
+                            user_id=user_id,
+                            ingredient_id=ingredient_id,
+                            amount=amount,
+                        )
+                    )
+                continue
+            item.amount += amount
+            if item.amount > 0:
+                changed.append(item)
+            else:
+                emptied.append(item.id)
+    if emptied:
+        ShoppingListItem.objects.filter(id__in=emptied).delete()
+    if changed:
+        ShoppingListItem.objects.bulk_update(changed, ["amount"])
+    if created:
+        ShoppingListItem.objects.bulk_create(created)
+
+
+def recipe_amounts(recipe_id, sign=1):
+    """{ingredient_id: amount} of the recipe, negated with sign=-1."""
+    return {
+        ingredient_id: sign * amount
+        for ingredient_id, amount in RecipeIngredient.objects.filter(
+            recipe_id=recipe_id
+        ).values_list("ingredient_id", "amount")
+    }
+
+
+def delta(before, after):
+    """Per-ingredient change between two {ingredient_id: amount} maps."""
+    return {
+        ingredient_id: after.get(ingredient_id, 0)
+        - before.get(ingredient_id, 0)
+        for ingredient_id in before.keys() | after.keys()
+    }
+
+
+@transaction.atomic
+def add_recipe(user_id, recipe_id):
+    """The recipe was put into the user's shopping cart."""
+    _apply([user_id], recipe_amounts(recipe_id))
+
+
+@transaction.atomic
+def remove_recipe(user_id, recipe_id):
+    """The recipe is being removed from the user's shopping cart."""
+    _apply([user_id], recipe_amounts(recipe_id, sign=-1))
+
+
+@transaction.atomic
+def change_recipe(recipe_id, amounts):
+    """Applies changed ingredient amounts of a recipe to the shopping
+    lists of all users who have it in the cart.
+    """
+    amounts = {key: value for key, value in amounts.items() if value}
+    if not amounts:
+        return
+    user_ids = list(
+        CartRecipe.objects.filter(recipe_id=recipe_id).values_list(
+            "user_id", flat=True
+        )
+    )
+    for start in range(0, len(user_ids), CHANGE_BATCH_SIZE):
+        _apply(user_ids[start:start + CHANGE_BATCH_SIZE], amounts)
+
+
+@transaction.atomic
+def rebuild(user_id):
+    """Recomputes the user's shopping list from the cart."""
+    ShoppingListItem.objects.filter(user_id=user_id).delete()
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(user_id=user_id, **row)
+        for row in RecipeIngredient.objects.filter(
+            recipe__ShoppingCart__user_id=user_id
+        )
+        .values("ingredient_id")
+        .annotate(amount=Sum("amount"))
+        .order_by()
+    )
@@ -0,0 +1,85 @@
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from recipes import feed, shopping_list
+from recipes.cache import bump_version_on_commit
+from recipes.counters import increment
+from recipes.models import (CartRecipe, FavoriteRecipe, Ingredient, Recipe,
+                            Tag, recipe_search_vector)
+from users.models import User
+
+
+def _casefold(value):
+    return None if value is None else value.casefold()
+
+
+@receiver(connection_created)
+def register_sqlite_functions(sender, connection, **kwargs):
+    """CASEFOLD for recipes.models.Casefold."""
+    if connection.vendor == "sqlite":
+        connection.connection.create_function(
+            "CASEFOLD", 1, _casefold, deterministic=True
+        )
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+@receiver([post_save, post_delete], sender=Tag)
+def reference_data_changed(sender, **kwargs):
+    bump_version_on_commit(sender)
+
+
+@receiver(post_save, sender=CartRecipe)
+def cart_recipe_added(sender, instance, created, **kwargs):
+    if created:
+        bump_version_on_commit(CartRecipe, instance.user_id)
+        shopping_list.add_recipe(instance.user_id, instance.recipe_id)
+        increment(Recipe, instance.recipe_id, "cart_count")
+
+
+@receiver(pre_delete, sender=CartRecipe)
+def cart_recipe_removed(sender, instance, **kwargs):
+    # pre_delete: when the recipe itself is deleted, all pre_delete
+    # handlers run before the cascade deletes its ingredient rows.
+    bump_version_on_commit(CartRecipe, instance.user_id)
+    shopping_list.remove_recipe(instance.user_id, instance.recipe_id)
+    increment(Recipe, instance.recipe_id, "cart_count", -1)
+
+
+@receiver(post_save, sender=FavoriteRecipe)
+def favorite_recipe_added(sender, instance, created, **kwargs):
+    if created:
+        bump_version_on_commit(FavoriteRecipe, instance.user_id)
+        # favorites_count orders ?ordering=popular lists.
+        bump_version_on_commit(FavoriteRecipe)
+        increment(Recipe, instance.recipe_id, "favorites_count")
+
+
+@receiver(post_delete, sender=FavoriteRecipe)
+def favorite_recipe_removed(sender, instance, **kwargs):
+    bump_version_on_commit(FavoriteRecipe, instance.user_id)
+    bump_version_on_commit(FavoriteRecipe)
+    increment(Recipe, instance.recipe_id, "favorites_count", -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        increment(User, instance.author_id, "recipes_count")
+        feed.fan_out(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, **kwargs):
+    bump_version_on_commit(Recipe)
+    if connections[instance._state.db].vendor == "postgresql":
+        Recipe.objects.filter(pk=instance.pk).update(
+            search_vector=recipe_search_vector()
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    bump_version_on_commit(Recipe)
+    increment(User, instance.author_id, "recipes_count", -1)
@@ -0,0 +1,41 @@
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentHashStorage(FileSystemStorage):
+    """File system storage that names files after the SHA-256 of their
+    content: <directory>/<ab>/<abcdef...>.<ext>.
+
+    Saving content that is already stored writes nothing and returns the
+    existing name after updating its modification time, so a file may be
+    shared by several records and is never deleted directly; see the
+    gc_recipe_images command.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        content.seek(0)
+        digest = digest.hexdigest()
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        name = os.path.join(directory, digest[:2], digest + extension)
+        if self.exists(name):
+            # The file may be unreferenced and older than the gc grace
+            # period; touching it keeps gc_recipe_images from deleting it
+            # before the record that reuses it is saved.
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
+
+
+def recipe_image_storage():
+    return ContentHashStorage()
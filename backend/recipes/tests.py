@@ -0,0 +1,451 @@
+import base64
+import io
+import os
+import tempfile
+import tracemalloc
+from types import SimpleNamespace
+
+from django.core.files.uploadedfile import (InMemoryUploadedFile,
+                                            SimpleUploadedFile,
+                                            TemporaryUploadedFile)
+from django.contrib.admin.sites import AdminSite
+from django.test import SimpleTestCase, TestCase, override_settings
+from PIL import ExifTags, Image
+from rest_framework.test import APIClient
+
+from recipes import images, shopping_list
+from recipes.admin import RecipeAdmin
+from recipes.models import (CartRecipe, FeedEntry, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingListItem)
+from users.models import Follow, User
+
+MB = 1024 * 1024
+
+
+def data_uri(content):
+    return "data:image/png;base64," + base64.b64encode(content).decode()
+
+
+@override_settings(RECIPE_IMAGE_MAX_SIZE=10 * MB)
+class DecodeDataUriTests(SimpleTestCase):
+    """images.decode_data_uri decodes in chunks without holding the whole
+    decoded image in memory.
+    """
+
+    def test_peak_memory_does_not_grow_with_the_image(self):
+        content = os.urandom(8 * MB)
+        uri = data_uri(content)
+        tracemalloc.start()
+        try:
+            file = images.decode_data_uri(uri)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.addCleanup(file.close)
+        self.assertIsInstance(file, TemporaryUploadedFile)
+        self.assertEqual(file.size, len(content))
+        self.assertEqual(file.read(), content)
+        # Chunks are 64 KiB, a whole-payload decode would need 8 MB.
+        self.assertLess(peak, MB)
+
+    def test_small_images_stay_in_memory(self):
+        content = os.urandom(1024)
+        file = images.decode_data_uri(data_uri(content))
+        self.assertIsInstance(file, InMemoryUploadedFile)
+        self.assertEqual(file.read(), content)
+
+    def test_whitespace_in_payload_is_ignored(self):
+        content = os.urandom(100 * 1024)
+        uri = data_uri(content)
+        wrapped = "\n".join(uri[i:i + 76] for i in range(0, len(uri), 76))
+        self.assertEqual(images.decode_data_uri(wrapped).read(), content)
+
+    @override_settings(RECIPE_IMAGE_MAX_SIZE=MB)
+    def test_oversized_payload_is_rejected_before_decoding(self):
+        with self.assertRaisesMessage(images.ImageError, "smaller than"):
+            images.decode_data_uri(data_uri(os.urandom(2 * MB)))
+
+    def test_invalid_payloads_are_rejected(self):
+        for uri in (
+            "data:image/png",
+            "data:image/png;base64,abc",
+            "data:image/png;base64,@@@@",
+        ):
+            with self.subTest(uri=uri):
+                with self.assertRaises(images.ImageError):
+                    images.decode_data_uri(uri)
+
+
+def upload(image_format, exif=None):
+    buffer = io.BytesIO()
+    image = Image.new("RGB", (40, 20), (200, 30, 30))
+    if exif is None:
+        image.save(buffer, image_format)
+    else:
+        image.save(buffer, image_format, exif=exif)
+    return SimpleUploadedFile(
+        f"image.{image_format.lower()}", buffer.getvalue(), "image/jpeg"
+    )
+
+
+class StripMetadataTests(TestCase):
+    """images.build_variants replaces originals carrying EXIF data with
+    a stripped copy, uploads are stored as they were received.
+    """
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.author = create_user("author")
+
+    def create_recipe(self, file):
+        return Recipe.objects.create(
+            author=self.author, name="recipe", text="text", cooking_time=5,
+            image=file,
+        )
+
+    def test_exif_is_removed_and_orientation_applied(self):
+        exif = Image.Exif()
+        exif[ExifTags.Base.Orientation] = 6
+        exif[ExifTags.Base.Make] = "Camera"
+        exif.get_ifd(ExifTags.IFD.GPSInfo)[ExifTags.GPS.GPSLatitudeRef] = "N"
+        recipe = self.create_recipe(upload("JPEG", exif))
+        uploaded = recipe.image.name
+        images.build_variants(recipe)
+        self.assertNotEqual(recipe.image.name, uploaded)
+        self.assertEqual(
+            Recipe.objects.get(pk=recipe.pk).image.name, recipe.image.name
+        )
+        with recipe.image.open("rb") as file, Image.open(file) as image:
+            self.assertEqual(image.format, "JPEG")
+            self.assertEqual(image.size, (20, 40))
+            self.assertFalse(image.getexif())
+            self.assertNotIn("exif", image.info)
+        self.assertEqual(
+            set(recipe.image_variants), set(images.VARIANTS)
+        )
+
+    def test_uploads_without_exif_are_kept(self):
+        recipe = self.create_recipe(upload("PNG"))
+        uploaded = recipe.image.name
+        images.build_variants(recipe)
+        self.assertEqual(recipe.image.name, uploaded)
+        self.assertEqual(
+            Recipe.objects.get(pk=recipe.pk).image.name, uploaded
+        )
+
+
+def create_user(username):
+    return User.objects.create_user(
+        email=f"{username}@example.com",
+        username=username,
+        password="password",
+        first_name=username,
+        last_name=username,
+    )
+
+
+class ShoppingListTests(TestCase):
+    """recipes.shopping_list keeps the totals equal to a rebuild from the
+    carts whatever changes.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user("author")
+        cls.buyer = create_user("buyer")
+        cls.other = create_user("other")
+        cls.flour, cls.egg, cls.milk = (
+            Ingredient.objects.create(name=name, measurement_unit="g")
+            for name in ("flour", "egg", "milk")
+        )
+        cls.pancakes = cls.create_recipe(
+            "pancakes", {cls.flour: 100, cls.egg: 2}
+        )
+        cls.omelette = cls.create_recipe(
+            "omelette", {cls.egg: 3, cls.milk: 50}
+        )
+
+    @classmethod
+    def create_recipe(cls, name, amounts):
+        recipe = Recipe.objects.create(
+            author=cls.author, name=name, text="text", cooking_time=5
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                             amount=amount)
+            for ingredient, amount in amounts.items()
+        )
+        return recipe
+
+    def totals(self, user):
+        return dict(
+            ShoppingListItem.objects.filter(user=user).values_list(
+                "ingredient_id", "amount"
+            )
+        )
+
+    def assertTotals(self, user, expected):
+        totals = self.totals(user)
+        self.assertEqual(
+            totals,
+            {ingredient.id: amount for ingredient, amount in expected.items()},
+        )
+        shopping_list.rebuild(user.id)
+        self.assertEqual(self.totals(user), totals)
+
+    def test_cart_add_sums_the_recipes(self):
+        CartRecipe.objects.create(user=self.buyer, recipe=self.pancakes)
+        CartRecipe.objects.create(user=self.buyer, recipe=self.omelette)
+        self.assertTotals(
+            self.buyer, {self.flour: 100, self.egg: 5, self.milk: 50}
+        )
+
+    def test_cart_remove_drops_emptied_items(self):
+        CartRecipe.objects.create(user=self.buyer, recipe=self.pancakes)
+        CartRecipe.objects.create(user=self.buyer, recipe=self.omelette)
+        CartRecipe.objects.filter(
+            user=self.buyer, recipe=self.omelette
+        ).delete()
+        self.assertTotals(self.buyer, {self.flour: 100, self.egg: 2})
+
+    def test_ingredient_edit_applies_to_every_cart(self):
+        for user in (self.buyer, self.other):
+            CartRecipe.objects.create(user=user, recipe=self.pancakes)
+        CartRecipe.objects.create(user=self.other, recipe=self.omelette)
+        client = APIClient()
+        client.force_authenticate(self.author)
+        response = client.patch(
+            f"/api/recipes/{self.pancakes.id}/",
+            {
+                "name": "pancakes",
+                "text": "text",
+                "cooking_time": 5,
+                "tags": [],
+                "ingredients": [
+                    {"id": self.flour.id, "amount": 150},
+                    {"id": self.milk.id, "amount": 200},
+                ],
+            },
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTotals(self.buyer, {self.flour: 150, self.milk: 200})
+        self.assertTotals(
+            self.other, {self.flour: 150, self.egg: 3, self.milk: 250}
+        )
+
+    def test_admin_inline_edit_applies_to_every_cart(self):
+        CartRecipe.objects.create(user=self.buyer, recipe=self.pancakes)
+        rows = RecipeIngredient.objects.filter(recipe=self.pancakes)
+
+        def save_inline():
+            rows.filter(ingredient=self.egg).delete()
+            rows.filter(ingredient=self.flour).update(amount=120)
+
+        form = SimpleNamespace(
+            instance=self.pancakes, save_m2m=lambda: None
+        )
+        RecipeAdmin(Recipe, AdminSite()).save_related(
+            None, form, [SimpleNamespace(save=save_inline)], change=True
+        )
+        self.assertTotals(self.buyer, {self.flour: 120})
+
+    def test_recipe_delete_subtracts_it_from_carts(self):
+        for recipe in (self.pancakes, self.omelette):
+            CartRecipe.objects.create(user=self.buyer, recipe=recipe)
+        self.omelette.delete()
+        self.assertTotals(self.buyer, {self.flour: 100, self.egg: 2})
+
+
+@override_settings(FEED_MAX_ENTRIES=3, FEED_FANOUT_MAX_FOLLOWERS=2)
+class FeedTests(TestCase):
+    """recipes.feed writes recipes to the followers' feeds or merges
+    them in on read, and the feed shows the same recipes either way.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user("author")
+        cls.readers = [create_user(f"reader{i}") for i in range(3)]
+
+    def follow(self, user):
+        Follow.objects.create(user=user, author=self.author)
+
+    def unfollow(self, user):
+        Follow.objects.filter(user=user, author=self.author).delete()
+
+    def publish(self, name):
+        return Recipe.objects.create(
+            author=User.objects.get(pk=self.author.pk),
+            name=name,
+            text="text",
+            cooking_time=5,
+        )
+
+    def feed(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get("/api/feed/", {"limit": 10})
+        self.assertEqual(response.status_code, 200)
+        return [recipe["name"] for recipe in response.json()["results"]]
+
+    def entries(self, user):
+        return FeedEntry.objects.filter(user=user).count()
+
+    def test_new_recipes_are_written_to_the_followers_feeds(self):
+        reader, stranger = self.readers[:2]
+        self.follow(reader)
+        self.publish("a")
+        self.publish("b")
+        self.assertEqual(self.entries(reader), 2)
+        self.assertEqual(self.feed(reader), ["b", "a"])
+        self.assertEqual(self.feed(stranger), [])
+
+    def test_feeds_are_trimmed_to_the_newest_entries(self):
+        reader = self.readers[0]
+        self.follow(reader)
+        for name in "abcd":
+            self.publish(name)
+        self.assertEqual(self.entries(reader), 3)
+        self.assertEqual(self.feed(reader), ["d", "c", "b"])
+
+    def test_follow_backfills_and_unfollow_removes(self):
+        reader = self.readers[0]
+        self.publish("a")
+        self.publish("b")
+        self.follow(reader)
+        self.assertEqual(self.feed(reader), ["b", "a"])
+        self.unfollow(reader)
+        self.assertEqual(self.entries(reader), 0)
+        self.assertEqual(self.feed(reader), [])
+
+    def test_recipes_of_popular_authors_are_merged_on_read(self):
+        for reader in self.readers:
+            self.follow(reader)
+        recipe = self.publish("a")
+        self.assertFalse(Recipe.objects.get(pk=recipe.pk).fanned_out)
+        self.assertEqual(FeedEntry.objects.count(), 0)
+        self.assertEqual(self.feed(self.readers[0]), ["a"])
+
+    def test_switching_modes_loses_nothing(self):
+        first, second, third = self.readers
+        self.follow(first)
+        self.follow(second)
+        self.publish("a")
+        self.follow(third)
+        self.publish("b")
+        self.assertEqual(self.feed(third), ["b", "a"])
+        self.unfollow(third)
+        self.publish("c")
+        self.assertEqual(self.feed(first), ["c", "b", "a"])
+        self.follow(third)
+        self.assertEqual(self.feed(third), ["c", "b", "a"])
+
+    @override_settings(FEED_MAX_ENTRIES=10)
+    def test_pages_merge_written_and_pulled_recipes(self):
+        first, second, third = self.readers
+        self.follow(first)
+        self.follow(second)
+        self.publish("a")
+        self.publish("b")
+        self.follow(third)
+        self.publish("c")
+        self.unfollow(third)
+        self.publish("d")
+        client = APIClient()
+        client.force_authenticate(first)
+        response = client.get("/api/feed/", {"limit": 2, "page": 2})
+        self.assertEqual(response.json()["count"], 4)
+        self.assertEqual(
+            [recipe["name"] for recipe in response.json()["results"]],
+            ["b", "a"],
+        )
+        pages = []
+        url = "/api/feed/?limit=2&cursor="
+        while url:
+            response = client.get(url).json()
+            pages.append([recipe["name"] for recipe in response["results"]])
+            url = response["next"]
+        self.assertEqual(pages, [["d", "c"], ["b", "a"]])
+
+
+class ByIngredientsTests(TestCase):
+    """Recipes ranked by how many of their ingredients are at hand."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user("author")
+        cls.ingredients = [
+            Ingredient.objects.create(name=f"ingredient{i}",
+                                      measurement_unit="g")
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+        self.recipes = {}
+        for name, indexes in (
+            ("r1", (0, 1)),
+            ("r2", (0, 1, 2)),
+            ("r3", (0,)),
+            ("r4", (3, 4)),
+            ("r5", (0, 3)),
+        ):
+            self.recipes[name] = self.save(name, indexes)
+
+    def save(self, name, indexes, pk=None):
+        data = {
+            "name": name,
+            "text": "text",
+            "cooking_time": 5,
+            "tags": [],
+            "ingredients": [
+                {"id": self.ingredients[i].id, "amount": 1} for i in indexes
+            ],
+        }
+        if pk is None:
+            response = self.client.post("/api/recipes/", data, format="json")
+        else:
+            response = self.client.patch(
+                f"/api/recipes/{pk}/", data, format="json"
+            )
+        self.assertIn(response.status_code, (200, 201))
+        return response.json()["id"]
+
+    def ranking(self, *indexes):
+        response = self.client.get(
+            "/api/recipes/by_ingredients/",
+            {"ingredients": ",".join(
+                str(self.ingredients[i].id) for i in indexes
+            )},
+        )
+        self.assertEqual(response.status_code, 200)
+        return [
+            (recipe["name"], recipe["matched"], recipe["missing"])
+            for recipe in response.json()["results"]
+        ]
+
+    def test_fewest_missing_then_most_matched_first(self):
+        self.assertEqual(
+            self.ranking(0, 1),
+            [("r1", 2, 0), ("r3", 1, 0), ("r2", 2, 1), ("r5", 1, 1)],
+        )
+
+    def test_edited_ingredients_are_counted(self):
+        self.save("r2", (0, 1), pk=self.recipes["r2"])
+        self.assertEqual(
+            Recipe.objects.get(pk=self.recipes["r2"]).ingredients_count, 2
+        )
+        self.assertEqual(
+            self.ranking(0, 1),
+            [("r2", 2, 0), ("r1", 2, 0), ("r3", 1, 0), ("r5", 1, 1)],
+        )
+
+    @override_settings(RECIPES_BY_INGREDIENTS_CANDIDATES=2)
+    def test_only_the_newest_candidates_are_ranked(self):
+        self.assertEqual(self.ranking(0, 1), [("r3", 1, 0), ("r5", 1, 1)])
@@ -0,0 +1,23 @@
+# Generated by Django 3.2 on 2026-10-18 03:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_auto_20230816_2151'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Followers count'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Recipes count'),
+        ),
+    ]
@@ -51,6 +51,12 @@ class User(AbstractUser):
         choices=UserRoles.choices,
         max_length=12,
     )
+    recipes_count = models.PositiveIntegerField(
+        "Recipes count", default=0, editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        "Followers count", default=0, editable=False
+    )
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ['username']
@@ -0,0 +1,30 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes import feed
+from recipes.cache import bump_version_on_commit
+from recipes.counters import increment
+from users.models import Follow, User
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        bump_version_on_commit(Follow, instance.user_id)
+        increment(User, instance.author_id, "followers_count")
+        instance.author.refresh_from_db(fields=["followers_count"])
+        feed.backfill(instance.user_id, instance.author)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    bump_version_on_commit(Follow, instance.user_id)
+    increment(User, instance.author_id, "followers_count", -1)
+    feed.remove(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    # Recipes embed their author, logins only touch last_login.
+    if update_fields != frozenset({"last_login"}):
+        bump_version_on_commit(User)